@@ -6,7 +6,12 @@ Copyright (C) 2002-2010 Stuart Rackham. Free use of this software is granted
 under the terms of the GNU General Public License (GPL).
 """
 
-import sys, os, re, time, traceback, tempfile, subprocess, codecs, locale, unicodedata, copy
+import sys, os, re, time, traceback, tempfile, subprocess, codecs, locale, unicodedata, copy, cPickle, cStringIO, glob, fnmatch, sre_parse, sre_compile, signal
+from collections import deque
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None  # --batch renders the documents in this process.
 
 ### Used by asciidocapi.py ###
 VERSION = '8.6.9'           # See CHANGLOG file for version history.
@@ -84,6 +89,9 @@ class OrderedDict(dict):
             if key not in self._keys: self._keys.append(key)
     def values(self):
         return map(self.get, self._keys)
+    def __reduce__(self):
+        # Restore the items with __setitem__() so the key order is rebuilt.
+        return (self.__class__, (), None, None, iter(self.items()))
 
 class AttrDict(dict):
     """
@@ -105,6 +113,8 @@ class AttrDict(dict):
         return dict(self)
     def __setstate__(self,value):
         for k,v in value.items(): self[k]=v
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
 
 class InsensitiveDict(dict):
     """
@@ -320,6 +330,160 @@ def re_join(relist):
     result = '('+result+')'
     return result
 
+def re_switch(relist):
+    """Compile regular expressions re1,re2,... to a single regular expression
+    (?P<_0>re1)|(?P<_1>re2)|... so the name of the last matched group of a
+    match is the index of the first expression that matches. Return None if
+    the expressions cannot be combined (back references or conflicting inline
+    flags)."""
+    if len(relist) == 0:
+        return None
+    flags = set()
+    for s in relist:
+        if re.search(r'\\\d|\(\?P=', s):
+            return None
+        try:
+            flags.add(sre_parse.parse(s).pattern.flags)
+        except re.error:
+            return None
+    if len(flags) != 1:
+        # Inline flags apply to the whole combined expression.
+        return None
+    result = []
+    for i,s in enumerate(relist):
+        result.append('(?P<_%d>%s)' % (i, re.sub(r'\?P<\S+?>','',s)))
+    try:
+        return re.compile('|'.join(result))
+    except re.error:
+        return None
+
+def re_words(words):
+    """Return a regular expression matching any of the literal strings in
+    list 'words'. The strings are merged into a prefix tree so the
+    expression is scanned in a single pass, a longer word is matched in
+    preference to a word that is its prefix."""
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c,{})
+        node[''] = None     # End of word.
+    def join(node):
+        result = [re.escape(c) + join(node[c]) for c in sorted(node) if c]
+        if len(result) == 0:
+            return ''
+        if len(result) == 1 and '' not in node:
+            return result[0]
+        result = '(?:' + '|'.join(result) + ')'
+        if '' in node:
+            result += '?'
+        return result
+    return join(trie)
+
+ALL_CHARS = [chr(i) for i in range(256)]
+firstchars_cache = {}   # re_firstchars() results keyed by pattern.
+
+def re_firstchars(pattern):
+    """Return the set of characters a match of regular expression 'pattern'
+    can start with or None if a match can start with any character (or is
+    empty)."""
+    if pattern in firstchars_cache:
+        return firstchars_cache[pattern]
+    def charset(item):
+        op,av = item
+        if not state.flags & re.IGNORECASE:
+            # Literal characters and ranges don't need compiling.
+            if op == sre_parse.LITERAL:
+                return set(ALL_CHARS[av:av+1])
+            if op == sre_parse.IN and all(o in (sre_parse.LITERAL,
+                    sre_parse.RANGE) for o,a in av):
+                result = set()
+                for o,a in av:
+                    if o == sre_parse.LITERAL:
+                        a = (a,a)
+                    result.update(ALL_CHARS[a[0]:a[1]+1])
+                return result
+        # Match the characters against the item compiled on its own so
+        # flags (ignore case, unicode) are honored.
+        reo = sre_compile.compile(sre_parse.SubPattern(state, [item]))
+        return set([c for c in ALL_CHARS if reo.match(c)])
+    def first(items):
+        # Return (chars,nullable) for sequence of parsed items.
+        result = set()
+        for op,av in items:
+            if op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL,
+                    sre_parse.IN, sre_parse.ANY):
+                return (result | charset((op,av)), False)
+            elif op in (sre_parse.AT, sre_parse.ASSERT,
+                    sre_parse.ASSERT_NOT):
+                continue    # Zero width.
+            elif op == sre_parse.SUBPATTERN:
+                chars,nullable = first(av[1])
+            elif op == sre_parse.BRANCH:
+                chars,nullable = set(),False
+                for branch in av[1]:
+                    c,n = first(branch)
+                    if c is None:
+                        return (None, True)
+                    chars |= c
+                    nullable = nullable or n
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                chars,nullable = first(av[2])
+                nullable = nullable or av[0] == 0
+            else:
+                return (None, True)
+            if chars is None:
+                return (None, True)
+            result |= chars
+            if not nullable:
+                return (result, False)
+        return (result, True)
+    try:
+        parsed = sre_parse.parse(pattern)
+        state = parsed.pattern
+        chars,nullable = first(parsed)
+    except Exception:
+        chars,nullable = None,True
+    if nullable:
+        result = None
+    else:
+        result = frozenset(chars)
+    firstchars_cache[pattern] = result
+    return result
+
+def re_literals(pattern):
+    """Return list of the literal strings every match of regular expression
+    'pattern' contains (runs of consecutive literal characters outside
+    alternatives and optional items)."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    if parsed.pattern.flags & re.IGNORECASE:
+        return []
+    result = []
+    run = ['']
+    def flush():
+        if run[0]:
+            result.append(run[0])
+        run[0] = ''
+    def scan(items):
+        for op,av in items:
+            if op == sre_parse.LITERAL and av < 256:
+                run[0] += chr(av)
+            elif op == sre_parse.SUBPATTERN:
+                scan(av[1])
+            else:
+                flush()
+                if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) \
+                        and av[0] >= 1 and len(av[2]) == 1:
+                    # Mandatory repeated item.
+                    scan(av[2])
+                    flush()
+    scan(parsed)
+    flush()
+    return result
+
 def lstrip_list(s):
     """
     Return list with empty items from start of list removed.
@@ -375,6 +539,14 @@ def dovetail_tags(stag,content,etag):
     """Merge the end tag with the first content line and the last
     content line with the end tag. This ensures verbatim elements don't
     include extraneous opening and closing line breaks."""
+    if len(stag) == 1 and len(etag) == 1 and stag[0] and etag[0]:
+        # Common single tag case.
+        content = strip_list(content)
+        if len(content) == 1:
+            return [stag[0] + content[0] + etag[0]]
+        elif content:
+            return ([stag[0] + content[0]] + list(content[1:-1]) +
+                    [content[-1] + etag[0]])
     return dovetail(dovetail(stag,content), etag)
 
 # The following functions are so we don't have to use the dangerous
@@ -575,46 +747,43 @@ def is_name(s):
 def subs_quotes(text):
     """Quoted text is marked up and the resulting text is
     returned."""
-    keys = config.quotes.keys()
-    for q in keys:
-        i = q.find('|')
-        if i != -1 and q != '|' and q != '||':
-            lq = q[:i]      # Left quote.
-            rq = q[i+1:]    # Right quote.
-        else:
-            lq = rq = q
-        tag = config.quotes[q]
-        if not tag: continue
-        # Unconstrained quotes prefix the tag name with a hash.
-        if tag[0] == '#':
-            tag = tag[1:]
-            # Unconstrained quotes can appear anywhere.
-            reo = re.compile(r'(?msu)(^|.)(\[(?P<attrlist>[^[\]]+?)\])?' \
-                    + r'(?:' + re.escape(lq) + r')' \
-                    + r'(?P<content>.+?)(?:'+re.escape(rq)+r')')
-        else:
-            # The text within constrained quotes must be bounded by white space.
-            # Non-word (\W) characters are allowed at boundaries to accomodate
-            # enveloping quotes and punctuation e.g. a='x', ('x'), 'x', ['x'].
-            reo = re.compile(r'(?msu)(^|[^\w;:}])(\[(?P<attrlist>[^[\]]+?)\])?' \
-                + r'(?:' + re.escape(lq) + r')' \
-                + r'(?P<content>\S|\S.*?\S)(?:'+re.escape(rq)+r')(?=\W|$)')
+    if config.quote_reos is None:
+        config.compile_quotes()
+    for lq,tag,reo in config.quote_reos:
+        if lq not in text:
+            continue    # Quote can't match.
+        result = []     # Substituted text fragments.
+        start = 0       # Start of text not yet copied to result.
         pos = 0
         while True:
             mo = reo.search(text,pos)
             if not mo: break
             if text[mo.start()] == '\\':
                 # Delete leading backslash.
-                text = text[:mo.start()] + text[mo.start()+1:]
+                result.append(text[start:mo.start()])
+                start = mo.start() + 1
                 # Skip past start of match.
-                pos = mo.start() + 1
+                pos = mo.start() + 2
             else:
                 attrlist = {}
                 parse_attributes(mo.group('attrlist'), attrlist)
                 stag,etag = config.tag(tag, attrlist)
                 s = mo.group(1) + stag + mo.group('content') + etag
-                text = text[:mo.start()] + s + text[mo.end():]
-                pos = mo.start() + len(s)
+                result.append(text[start:mo.start()])
+                result.append(s)
+                if (s[-1:] == '\n') != (text[mo.end()-1] == '\n'):
+                    # A ^ anchor at the next match depends on the
+                    # substituted text so join it now.
+                    tail = text[mo.end():]
+                    text = ''.join(result) + tail
+                    pos = len(text) - len(tail)
+                    start = 0
+                    result = []
+                else:
+                    start = pos = mo.end()
+        if result:
+            result.append(text[start:])
+            text = ''.join(result)
     return text
 
 def subs_tag(tag,dict={}):
@@ -732,18 +901,22 @@ def is_attr_defined(attrs,dic):
     <attr1>,<attr2>,... Return True if one or more attributes are defined.
     <attr1>+<attr2>+... Return True if all the attributes are defined.
     """
+    if isinstance(dic, ConfAttributes):
+        defined = dic.isdefined
+    else:
+        defined = lambda a: dic.get(a) is not None
     if OR in attrs:
         for a in attrs.split(OR):
-            if dic.get(a.strip()) is not None:
+            if defined(a.strip()):
                 return True
         else: return False
     elif AND in attrs:
         for a in attrs.split(AND):
-            if dic.get(a.strip()) is None:
+            if not defined(a.strip()):
                 return False
         else: return True
     else:
-        return dic.get(attrs.strip()) is not None
+        return defined(attrs.strip())
 
 def filter_lines(filter_cmd, lines, attrs={}):
     """
@@ -803,6 +976,7 @@ def filter_lines(filter_cmd, lines, attrs={}):
             message.warning('filter not found: %s' % cmd)
     if found:
         filter_cmd = '"' + found + '"' + mo.group('tail')
+        document.depend(found)
     if found:
         if cmd.endswith('.py'):
             filter_cmd = '"%s" %s' % (document.attributes['python'],
@@ -868,6 +1042,11 @@ def system(name, args, is_macro=False, attrs=None):
     if safe() and name not in ('include','include1'):
         message.unsafe(syntax)
         return None
+    if name in ('eval','eval3','sys','sys2','sys3'):
+        confcache.volatile()
+        document.volatile = True
+    if name not in ('counter','counter2','set','set2','template'):
+        sectcache.volatile()
     result = None
     if name in ('eval','eval3'):
         try:
@@ -968,10 +1147,12 @@ def system(name, args, is_macro=False, attrs=None):
             result = ''
     elif name == 'include':
         if not os.path.exists(args):
+            document.depend(args)
             message.warning('%s: file does not exist' % syntax)
         elif not is_safe_file(args):
             message.unsafe(syntax)
         else:
+            document.depend(args)
             f = open(args)
             try:
                 result = [s.rstrip() for s in f]
@@ -1002,6 +1183,179 @@ def system(name, args, is_macro=False, attrs=None):
         result = '\x07' + str(len(macros.passthroughs)-1) + '\x07'
     return result
 
+class AttrsCache(object):
+    """
+    Memoizes the simple and conditional attribute reference substitution of
+    subs_attrs() lines. A line maps to a list of (refs,result) entries where
+    refs is a tuple of the (name,value) attribute lookups the result depends
+    on, the entry is used only if all the named attributes still have the
+    same values.
+
+    Lines that only contain simple references and single name conditional
+    references (with no nested conditional or system references) are
+    instead compiled once to a list of literal strings and references
+    (see template()) which subs() evaluates without rescanning the line.
+    """
+    MAX_LINES = 10000   # Cache is cleared when it grows larger than this.
+    MAX_ENTRIES = 4     # Maximum number of cached results per line.
+    # Result states.
+    DONE = 0            # Substitution complete.
+    SYSTEM = 1          # Contains system attribute references.
+    DROPPED = 2         # Contains undefined attribute references.
+    RE_REF = re.compile(r'\{([0-9A-Za-z_][-0-9A-Za-z_]*)([}=?!#%])')
+    def __init__(self):
+        self.lines = {}
+        self.templates = {}
+    def template(self, line):
+        """
+        Return 'line' compiled to a list of literal strings, (name,)
+        attribute references and (name,op,parts) conditional references
+        ('parts' contains literal strings and attribute references). Return
+        None if the line needs full subs_attrs() substitution.
+        """
+        result = self.templates.get(line)
+        if result is None:
+            if len(self.templates) >= self.MAX_LINES:
+                self.templates.clear()
+            result = self.templates[line] = self.compile(line)
+        return result or None
+    def compile(self, line):
+        """Return compiled 'line' or False (see template())."""
+        if '\\' in line:
+            return False    # Escaped braces.
+        result = []
+        pos = 0
+        while True:
+            i = line.find('{',pos)
+            if i == -1:
+                break
+            if '}' in line[pos:i]:
+                return False
+            if i > pos:
+                result.append(line[pos:i])
+            mo = self.RE_REF.match(line,i)
+            if not mo:
+                return False
+            pos = mo.end()
+            if mo.group(2) == '}':
+                result.append((mo.group(1),))
+                continue
+            # Conditional reference value.
+            parts = []
+            while True:
+                j = line.find('}',pos)
+                if j == -1:
+                    return False
+                i = line.find('{',pos,j)
+                if i == -1:
+                    if j > pos:
+                        parts.append(line[pos:j])
+                    pos = j + 1
+                    break
+                if i > pos:
+                    parts.append(line[pos:i])
+                ref = self.RE_REF.match(line,i)
+                if not ref or ref.group(2) != '}':
+                    return False
+                parts.append((ref.group(1),))
+                pos = ref.end()
+            result.append((mo.group(1),mo.group(2),parts))
+        if '}' in line[pos:]:
+            return False
+        if pos < len(line):
+            result.append(line[pos:])
+        return result
+    def subs(self, template, lookup):
+        """
+        Substitute compiled line 'template' using the 'lookup' attribute
+        lookup function and return the (state,line) result. Return None if
+        an attribute value contains braces (they could form new references).
+        """
+        def ref(name):
+            value = lookup(name)
+            if value is None:
+                return None
+            value = str(value)
+            if '{' in value or '}' in value:
+                raise ValueError
+            return value
+        result = []
+        dropped = False
+        try:
+            for part in template:
+                if type(part) is not tuple:
+                    result.append(part)
+                    continue
+                s = ref(part[0])
+                if len(part) == 1:
+                    if s is None:
+                        s = '{%s}' % part[0]
+                        dropped = True
+                    result.append(s)
+                    continue
+                # Conditional reference.
+                op = part[1]
+                rval = []
+                undefined = False
+                for p in part[2]:
+                    if type(p) is not tuple:
+                        rval.append(p)
+                    else:
+                        v = ref(p[0])
+                        if v is None:
+                            v = '{%s}' % p[0]
+                            undefined = True
+                        rval.append(v)
+                rval = ''.join(rval)
+                if s is None:
+                    if op in '=!%':
+                        s = rval
+                        dropped = dropped or undefined
+                    elif op == '?':
+                        s = ''
+                    else:
+                        s = '{zzzzz}'
+                        dropped = True
+                else:
+                    if op == '=':
+                        pass
+                    elif op in '?#':
+                        s = rval
+                        dropped = dropped or undefined
+                    elif op == '!':
+                        s = ''
+                    else:
+                        s = '{zzzzz}'
+                        dropped = True
+                result.append(s)
+        except ValueError:
+            return None
+        if dropped:
+            return (self.DROPPED, ''.join(result))
+        else:
+            return (self.DONE, ''.join(result))
+    def get(self, line, lookup):
+        """
+        Return cached (state,line) result for 'line' or None if there isn't
+        one, 'lookup' is the attribute lookup function.
+        """
+        for refs,result in self.lines.get(line,()):
+            for name,value in refs:
+                if lookup(name) != value:
+                    break
+            else:
+                return result
+        return None
+    def put(self, line, refs, result):
+        entries = self.lines.get(line)
+        if entries is None:
+            if len(self.lines) >= self.MAX_LINES:
+                self.lines.clear()
+            entries = self.lines[line] = []
+        elif len(entries) >= self.MAX_ENTRIES:
+            del entries[0]
+        entries.append((tuple(refs),result))
+
 def subs_attrs(lines, dictionary=None):
     """Substitute 'lines' of text with attributes from the global
     document.attributes dictionary and from 'dictionary' ('dictionary'
@@ -1012,6 +1366,9 @@ def subs_attrs(lines, dictionary=None):
     - Attribute references are substituted in the following order: simple,
       conditional, system.
     - Attribute references inside 'dictionary' entry values are substituted.
+
+    >>> subs_attrs('{a} \\}', {'a': 'foo \\} bar'})
+    'foo } bar }'
     """
 
     def end_brace(text,start):
@@ -1034,152 +1391,194 @@ def subs_attrs(lines, dictionary=None):
         lines = [lines]
     else:
         string_result = False
-    if dictionary is None:
-        attrs = document.attributes
-    else:
-        # Remove numbered document attributes so they don't clash with
-        # attribute list positional attributes.
-        attrs = {}
-        for k,v in document.attributes.items():
-            if not re.match(r'^\d+$', k):
-                attrs[k] = v
+    if dictionary is not None:
         # Substitute attribute references inside dictionary values.
         for k,v in dictionary.items():
             if v is None:
                 del dictionary[k]
             else:
-                v = subs_attrs(str(v))
+                v = str(v)
+                if '{' in v or '}' in v:
+                    v = subs_attrs(v)
                 if v is None:
                     del dictionary[k]
                 else:
                     dictionary[k] = v
-        attrs.update(dictionary)
+
+    def lookup(name):
+        """Return the value of attribute 'name' ('dictionary' entries take
+        precedence)."""
+        if dictionary is None:
+            return document.attributes.get(name)
+        if name in dictionary:
+            return dictionary[name]
+        if name.isdigit():
+            # Numbered document attributes would clash with attribute list
+            # positional attributes.
+            return None
+        return document.attributes.get(name)
+
+    def attr(name):
+        """Lookup attribute 'name' and record the reference in 'refs'."""
+        value = lookup(name)
+        refs.append((name,value))
+        return value
+
     # Substitute all attributes in all lines.
     result = []
     for line in lines:
-        # Make it easier for regular expressions.
-        line = line.replace('\\{','{\\')
-        line = line.replace('\\}','}\\')
-        # Expand simple attributes ({name}).
-        # Nested attributes not allowed.
-        reo = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)\}(?!\\)')
-        pos = 0
-        while True:
-            mo = reo.search(line,pos)
-            if not mo: break
-            s =  attrs.get(mo.group('name'))
-            if s is None:
-                pos = mo.end()
-            else:
-                s = str(s)
-                line = line[:mo.start()] + s + line[mo.end():]
-                pos = mo.start() + len(s)
-        # Expand conditional attributes.
-        # Single name -- higher precedence.
-        reo1 = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)' \
-                          r'(?P<op>\=|\?|!|#|%|@|\$)' \
-                          r'(?P<value>.*?)\}(?!\\)')
-        # Multiple names (n1,n2,... or n1+n2+...) -- lower precedence.
-        reo2 = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w'+OR+AND+r']*?)' \
-                          r'(?P<op>\=|\?|!|#|%|@|\$)' \
-                          r'(?P<value>.*?)\}(?!\\)')
-        for reo in [reo1,reo2]:
+        if '{' not in line and '}' not in line:
+            result.append(line)
+            continue
+        template = attrs_cache.template(line)
+        if template is not None:
+            cached = attrs_cache.subs(template, lookup)
+        else:
+            cached = attrs_cache.get(line, lookup)
+        if cached is None:
+            key = line
+            refs = []
+            cacheable = True
+            # Make it easier for regular expressions.
+            line = line.replace('\\{','{\\')
+            line = line.replace('\\}','}\\')
+            # Expand simple attributes ({name}).
+            # Nested attributes not allowed.
+            reo = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)\}(?!\\)')
             pos = 0
             while True:
                 mo = reo.search(line,pos)
                 if not mo: break
-                attr = mo.group()
-                name =  mo.group('name')
-                if reo == reo2:
-                    if OR in name:
-                        sep = OR
-                    else:
-                        sep = AND
-                    names = [s.strip() for s in name.split(sep) if s.strip() ]
-                    for n in names:
-                        if not re.match(r'^[^\\\W][-\w]*$',n):
-                            message.error('illegal attribute syntax: %s' % attr)
-                    if sep == OR:
-                        # Process OR name expression: n1,n2,...
-                        for n in names:
-                            if attrs.get(n) is not None:
-                                lval = ''
-                                break
+                s =  attr(mo.group('name'))
+                if s is None:
+                    pos = mo.end()
+                else:
+                    s = str(s)
+                    line = line[:mo.start()] + s + line[mo.end():]
+                    pos = mo.start() + len(s)
+            # Expand conditional attributes.
+            # Single name -- higher precedence.
+            reo1 = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w]*?)' \
+                              r'(?P<op>\=|\?|!|#|%|@|\$)' \
+                              r'(?P<value>.*?)\}(?!\\)')
+            # Multiple names (n1,n2,... or n1+n2+...) -- lower precedence.
+            reo2 = re.compile(r'(?su)\{(?P<name>[^\\\W][-\w'+OR+AND+r']*?)' \
+                              r'(?P<op>\=|\?|!|#|%|@|\$)' \
+                              r'(?P<value>.*?)\}(?!\\)')
+            for reo in [reo1,reo2]:
+                pos = 0
+                while True:
+                    mo = reo.search(line,pos)
+                    if not mo: break
+                    attr_ref = mo.group()
+                    name =  mo.group('name')
+                    if reo == reo2:
+                        if OR in name:
+                            sep = OR
                         else:
-                            lval = None
-                    else:
-                        # Process AND name expression: n1+n2+...
+                            sep = AND
+                        names = [s.strip() for s in name.split(sep) if s.strip() ]
                         for n in names:
-                            if attrs.get(n) is None:
+                            if not re.match(r'^[^\\\W][-\w]*$',n):
+                                message.error('illegal attribute syntax: %s' % attr_ref)
+                                cacheable = False
+                        if sep == OR:
+                            # Process OR name expression: n1,n2,...
+                            for n in names:
+                                if attr(n) is not None:
+                                    lval = ''
+                                    break
+                            else:
                                 lval = None
-                                break
                         else:
-                            lval = ''
-                else:
-                    lval =  attrs.get(name)
-                op = mo.group('op')
-                # mo.end() not good enough because '{x={y}}' matches '{x={y}'.
-                end = end_brace(line,mo.start())
-                rval = line[mo.start('value'):end-1]
-                UNDEFINED = '{zzzzz}'
-                if lval is None:
-                    if op == '=': s = rval
-                    elif op == '?': s = ''
-                    elif op == '!': s = rval
-                    elif op == '#': s = UNDEFINED   # So the line is dropped.
-                    elif op == '%': s = rval
-                    elif op in ('@','$'):
-                        s = UNDEFINED               # So the line is dropped.
+                            # Process AND name expression: n1+n2+...
+                            for n in names:
+                                if attr(n) is None:
+                                    lval = None
+                                    break
+                            else:
+                                lval = ''
                     else:
-                        assert False, 'illegal attribute: %s' % attr
-                else:
-                    if op == '=': s = lval
-                    elif op == '?': s = rval
-                    elif op == '!': s = ''
-                    elif op == '#': s = rval
-                    elif op == '%': s = UNDEFINED   # So the line is dropped.
-                    elif op in ('@','$'):
-                        v = re.split(r'(?<!\\):',rval)
-                        if len(v) not in (2,3):
-                            message.error('illegal attribute syntax: %s' % attr)
-                            s = ''
-                        elif not is_re('^'+v[0]+'$'):
-                            message.error('illegal attribute regexp: %s' % attr)
-                            s = ''
+                        lval =  attr(name)
+                    op = mo.group('op')
+                    # mo.end() not good enough because '{x={y}}' matches '{x={y}'.
+                    end = end_brace(line,mo.start())
+                    rval = line[mo.start('value'):end-1]
+                    UNDEFINED = '{zzzzz}'
+                    if lval is None:
+                        if op == '=': s = rval
+                        elif op == '?': s = ''
+                        elif op == '!': s = rval
+                        elif op == '#': s = UNDEFINED   # So the line is dropped.
+                        elif op == '%': s = rval
+                        elif op in ('@','$'):
+                            s = UNDEFINED               # So the line is dropped.
                         else:
-                            v = [s.replace('\\:',':') for s in v]
-                            re_mo = re.match('^'+v[0]+'$',lval)
-                            if op == '@':
-                                if re_mo:
-                                    s = v[1]         # {<name>@<re>:<v1>[:<v2>]}
-                                else:
-                                    if len(v) == 3:   # {<name>@<re>:<v1>:<v2>}
-                                        s = v[2]
-                                    else:             # {<name>@<re>:<v1>}
-                                        s = ''
+                            assert False, 'illegal attribute: %s' % attr_ref
+                    else:
+                        if op == '=': s = lval
+                        elif op == '?': s = rval
+                        elif op == '!': s = ''
+                        elif op == '#': s = rval
+                        elif op == '%': s = UNDEFINED   # So the line is dropped.
+                        elif op in ('@','$'):
+                            v = re.split(r'(?<!\\):',rval)
+                            if len(v) not in (2,3):
+                                message.error('illegal attribute syntax: %s' % attr_ref)
+                                cacheable = False
+                                s = ''
+                            elif not is_re('^'+v[0]+'$'):
+                                message.error('illegal attribute regexp: %s' % attr_ref)
+                                cacheable = False
+                                s = ''
                             else:
-                                if re_mo:
-                                    if len(v) == 2:   # {<name>$<re>:<v1>}
-                                        s = v[1]
-                                    elif v[1] == '':  # {<name>$<re>::<v2>}
-                                        s = UNDEFINED # So the line is dropped.
-                                    else:             # {<name>$<re>:<v1>:<v2>}
-                                        s = v[1]
+                                v = [s.replace('\\:',':') for s in v]
+                                re_mo = re.match('^'+v[0]+'$',lval)
+                                if op == '@':
+                                    if re_mo:
+                                        s = v[1]         # {<name>@<re>:<v1>[:<v2>]}
+                                    else:
+                                        if len(v) == 3:   # {<name>@<re>:<v1>:<v2>}
+                                            s = v[2]
+                                        else:             # {<name>@<re>:<v1>}
+                                            s = ''
                                 else:
-                                    if len(v) == 2:   # {<name>$<re>:<v1>}
-                                        s = UNDEFINED # So the line is dropped.
-                                    else:             # {<name>$<re>:<v1>:<v2>}
-                                        s = v[2]
-                    else:
-                        assert False, 'illegal attribute: %s' % attr
-                s = str(s)
-                line = line[:mo.start()] + s + line[end:]
-                pos = mo.start() + len(s)
-        # Drop line if it contains  unsubstituted {name} references.
-        skipped = re.search(r'(?su)\{[^\\\W][-\w]*?\}(?!\\)', line)
-        if skipped:
+                                    if re_mo:
+                                        if len(v) == 2:   # {<name>$<re>:<v1>}
+                                            s = v[1]
+                                        elif v[1] == '':  # {<name>$<re>::<v2>}
+                                            s = UNDEFINED # So the line is dropped.
+                                        else:             # {<name>$<re>:<v1>:<v2>}
+                                            s = v[1]
+                                    else:
+                                        if len(v) == 2:   # {<name>$<re>:<v1>}
+                                            s = UNDEFINED # So the line is dropped.
+                                        else:             # {<name>$<re>:<v1>:<v2>}
+                                            s = v[2]
+                        else:
+                            assert False, 'illegal attribute: %s' % attr_ref
+                    s = str(s)
+                    line = line[:mo.start()] + s + line[end:]
+                    pos = mo.start() + len(s)
+            # Drop line if it contains  unsubstituted {name} references.
+            if re.search(r'(?su)\{[^\\\W][-\w]*?\}(?!\\)', line):
+                cached = (AttrsCache.DROPPED, line)
+            elif re.search(r'(?su)\{[^\\\W][-\w]*?:.*?\}(?!\\)', line):
+                cached = (AttrsCache.SYSTEM, line)
+            else:
+                # Remove backslash from escaped entries.
+                line = line.replace('{\\','{')
+                line = line.replace('}\\','}')
+                cached = (AttrsCache.DONE, line)
+            if cacheable and template is None:
+                attrs_cache.put(key, refs, cached)
+        state,line = cached
+        if state == AttrsCache.DONE:
+            result.append(line)
+            continue
+        if state == AttrsCache.DROPPED:
             trace('dropped line', line)
-            continue;
+            continue
         # Expand system attributes (eval has precedence).
         reos = [
             re.compile(r'(?su)\{(?P<action>eval):(?P<expr>.*?)\}(?!\\)'),
@@ -1196,9 +1595,6 @@ def subs_attrs(lines, dictionary=None):
                 expr = expr.replace('{\\','{')
                 expr = expr.replace('}\\','}')
                 s = system(action, expr, attrs=dictionary)
-                if dictionary is not None and action in ('counter','counter2','set','set2'):
-                    # These actions create and update attributes.
-                    attrs.update(dictionary)
                 if s is None:
                     # Drop line if the action returns None.
                     skipped = True
@@ -1293,6 +1689,12 @@ class Lex:
     """Lexical analysis routines. Static methods and attributes only."""
     prev_element = None
     prev_cursor = None
+    # Names of the elements that can start with a given character, built from
+    # the loaded definitions by build_index() once the configuration is final.
+    # None if it has not been built (all the elements are checked).
+    index = None
+    ELEMENTS = frozenset(('attributeentry','attributelist','blocktitle',
+            'title','macros','lists','blocks','tables_OLD','tables'))
     def __init__(self):
         raise AssertionError,'no class instances allowed'
     @staticmethod
@@ -1307,26 +1709,33 @@ class Lex:
         # position return the element.
         if Lex.prev_element and Lex.prev_cursor == reader.cursor:
             return Lex.prev_element
-        if AttributeEntry.isnext():
+        # Only check for elements that can start with the first character.
+        line = reader.read_next()
+        if line and Lex.index is not None:
+            nexts = Lex.index.get(line[0], Lex.ELEMENTS)
+        else:
+            nexts = Lex.ELEMENTS
+        if 'attributeentry' in nexts and AttributeEntry.isnext():
             result = AttributeEntry
-        elif AttributeList.isnext():
+        elif 'attributelist' in nexts and AttributeList.isnext():
             result = AttributeList
-        elif BlockTitle.isnext() and not tables_OLD.isnext():
+        elif 'blocktitle' in nexts and BlockTitle.isnext() and not \
+                ('tables_OLD' in nexts and tables_OLD.isnext()):
             result = BlockTitle
-        elif Title.isnext():
+        elif Title.isnext('title' in nexts):
             if AttributeList.style() == 'float':
                 result = FloatingTitle
             else:
                 result = Title
-        elif macros.isnext():
+        elif 'macros' in nexts and macros.isnext():
             result = macros.current
-        elif lists.isnext():
+        elif 'lists' in nexts and lists.isnext():
             result = lists.current
-        elif blocks.isnext():
+        elif 'blocks' in nexts and blocks.isnext():
             result = blocks.current
-        elif tables_OLD.isnext():
+        elif 'tables_OLD' in nexts and tables_OLD.isnext():
             result = tables_OLD.current
-        elif tables.isnext():
+        elif 'tables' in nexts and tables.isnext():
             result = tables.current
         else:
             if not paragraphs.isnext():
@@ -1337,6 +1746,36 @@ class Lex:
         Lex.prev_element = result
         return result
 
+    @staticmethod
+    def build_index():
+        """Build Lex.index from the element patterns and the loaded block,
+        list, table and macro definitions."""
+        patterns = {
+            'attributeentry': [AttributeEntry.pattern or
+                    document.attributes.get('attributeentry-pattern')],
+            'attributelist': [AttributeList.pattern],
+            'blocktitle': [BlockTitle.pattern],
+            'title': [Title.dump_dict.get('sect%d' % level)
+                    for level in range(len(Title.underlines))],
+            'macros': [m.pattern for m in macros.macros if m.prefix == '#'],
+        }
+        for name,defs in (('lists',lists), ('blocks',blocks),
+                ('tables_OLD',tables_OLD), ('tables',tables)):
+            patterns[name] = [b.delimiter for b in defs.blocks]
+        index = dict([(c,set()) for c in ALL_CHARS])
+        for name,pats in patterns.items():
+            for pat in pats:
+                if not pat:
+                    continue
+                chars = re_firstchars(pat)
+                if chars is None:
+                    chars = ALL_CHARS
+                for c in chars:
+                    index[c].add(name)
+        for c in index:
+            index[c] = frozenset(index[c])
+        Lex.index = index
+
     @staticmethod
     def canonical_subs(options):
         """Translate composite subs values."""
@@ -1448,6 +1887,45 @@ class Document(object):
         self.has_errors = False # Set true if processing errors were flagged.
         self.has_warnings = False # Set true if warnings were flagged.
         self.safe = False       # Default safe mode.
+        self.dependencies = []  # Files the output was generated from.
+        self.missing = []       # Files probed for that did not exist.
+        # Set if the output depends on more than the dependencies and
+        # attributes (e.g. on the output of a system command).
+        self.volatile = False
+    def depend(self,fname):
+        """
+        Add file fname to the document dependencies, if fname does not exist
+        it is added to the missing files (creating it changes the output).
+        """
+        fname = os.path.abspath(fname)
+        if os.path.exists(fname):
+            deps = self.dependencies
+        else:
+            deps = self.missing
+        if fname not in deps:
+            deps.append(fname)
+    def write_depfile(self,fname):
+        """
+        Write make(1) rules listing the files the output file was generated
+        from to file fname. Each dependency also gets an empty rule so make
+        doesn't fail if it is deleted. The missing files are listed as targets
+        without prerequisites.
+        """
+        def escape(path):
+            # Escape make special characters the way gcc -MD does.
+            return re.sub(r'[\\ :#$]',
+                    lambda mo: mo.group() == '$' and '$$' or '\\' + mo.group(),
+                    path)
+        f = open(fname, 'w')
+        try:
+            f.write('%s:' % escape(self.outfile))
+            for dep in self.dependencies:
+                f.write(' \\\n  %s' % escape(dep))
+            f.write('\n')
+            for dep in self.dependencies + self.missing:
+                f.write('\n%s:\n' % escape(dep))
+        finally:
+            f.close()
     def update_attributes(self,attrs=None):
         """
         Set implicit attributes and attributes in 'attrs'.
@@ -1660,10 +2138,15 @@ class Document(object):
             if Lex.next() is not Title:
                 Section.translate_body()
         # Process remaining sections.
+        if confcache.token is None or 'trace' in self.attributes:
+            sectcache.start(None)
+        else:
+            sectcache.start((self.infile, confcache.token))
         while not reader.eof():
             if Lex.next() is not Title:
                 raise EAsciiDoc,'section title expected'
-            Section.translate()
+            sectcache.translate(Section.translate)
+        sectcache.finish()
         Section.setlevel(0) # Write remaining unwritten section close tags.
         # Substitute document parameters and write document footer.
         if config.header_footer:
@@ -1863,6 +2346,7 @@ class AttributeEntry:
             attr.value = attr.value[:-1] + reader.read().strip()
         if attr.name2 is not None:
             # Configuration file attribute.
+            confcache.token = None  # No longer matches the cached state.
             if attr.name2 != '':
                 # Section entry attribute.
                 section = {}
@@ -1921,6 +2405,7 @@ class AttributeList:
         if not 'attributelist-pattern' in document.attributes:
             message.error("[attributes] missing 'attributelist-pattern' entry")
         AttributeList.pattern = document.attributes['attributelist-pattern']
+        Lex.index = None
     @staticmethod
     def isnext():
         result = False  # Assume not next.
@@ -2043,19 +2528,20 @@ class Title:
             message.warning('blank section title')
         return title
     @staticmethod
-    def isnext():
+    def isnext(single=True):
         lines = reader.read_ahead(2)
-        return Title.parse(lines)
+        return Title.parse(lines, single)
     @staticmethod
-    def parse(lines):
-        """Parse title at start of lines tuple."""
+    def parse(lines, single=True):
+        """Parse title at start of lines tuple. Single-line titles are not
+        checked if 'single' is False."""
         if len(lines) == 0: return False
         if len(lines[0]) == 0: return False # Title can't be blank.
         # Check for single-line titles.
         result = False
         for level in range(len(Title.underlines)):
             k = 'sect%s' % level
-            if k in Title.dump_dict:
+            if single and k in Title.dump_dict:
                 mo = re.match(Title.dump_dict[k], lines[0])
                 if mo:
                     Title.attributes = mo.groupdict()
@@ -2537,7 +3023,7 @@ class AbstractBlock:
         if not self.presubs:
             self.presubs = config.subsnormal
         if reader.cursor:
-            self.start = reader.cursor[:]
+            self.start = reader.cursor
     def push_blockname(self, blockname=None):
         '''
         On block entry set the 'blockname' attribute.
@@ -2652,8 +3138,11 @@ class AbstractBlocks:
         self.blocks = []        # List of Block objects.
         self.default = None     # Default Block.
         self.delimiters = None  # Combined delimiters regular expression.
+        self.switch_reo = None  # Compiled re_switch() of block delimiters.
+        self.switch_blocks = {} # Blocks keyed by switch_reo group name.
     def load(self,sections):
         """Load block definition from 'sections' dictionary."""
+        self.switch_reo = None
         for k in sections.keys():
             if re.match(r'^'+ self.PREFIX + r'.+$',k):
                 d = {}
@@ -2672,6 +3161,19 @@ class AbstractBlocks:
         for b in self.blocks:
             b.dump()
     def isnext(self):
+        if self.switch_reo:
+            # Find the matching block with a single match then rematch with
+            # its own delimiter to set the block's named groups.
+            reader.skip_blank_lines()
+            line = reader.read_next()
+            if line:
+                mo = self.switch_reo.match(line)
+                if mo:
+                    b = self.switch_blocks[mo.lastgroup]
+                    if b.isnext():
+                        self.current = b
+                        return True
+            return False
         for b in self.blocks:
             if b.isnext():
                 self.current = b
@@ -2687,6 +3189,17 @@ class AbstractBlocks:
             if b.delimiter:
                 delimiters.append(b.delimiter)
         self.delimiters = re_join(delimiters)
+        self.build_switch()
+    def build_switch(self):
+        """Combine the block delimiters into a single regular expression
+        matched by isnext()."""
+        self.switch_reo = None
+        self.switch_blocks = {}
+        if [b for b in self.blocks if not b.delimiter]:
+            return
+        self.switch_reo = re_switch([b.delimiter for b in self.blocks])
+        for i,b in enumerate(self.blocks):
+            self.switch_blocks['_%d' % i] = b
 
 class Paragraph(AbstractBlock):
     def __init__(self):
@@ -2758,6 +3271,7 @@ class Paragraphs(AbstractBlocks):
                 break
         else:
             raise EAsciiDoc,'missing section: [paradef-default]'
+        self.build_switch()
 
 class List(AbstractBlock):
     NUMBER_STYLES= ('arabic','loweralpha','upperalpha','lowerroman',
@@ -3105,8 +3619,10 @@ class DelimitedBlocks(AbstractBlocks):
     def validate(self):
         AbstractBlocks.validate(self)
 
-class Column:
+class Column(object):
     """Table column."""
+    __slots__ = ('width','halign','valign','style','abswidth','pcwidth',
+                 'resolved')
     def __init__(self, width=None, align_spec=None, style=None):
         self.width = width or '1'
         self.halign, self.valign = Table.parse_align_spec(align_spec)
@@ -3114,8 +3630,10 @@ class Column:
         # Calculated attribute values.
         self.abswidth = None    # 1..   (page units).
         self.pcwidth = None     # 1..99 (percentage).
+        self.resolved = None    # Table.resolve_style(style) tuple.
 
-class Cell:
+class Cell(object):
+    __slots__ = ('data','span','vspan','halign','valign','style','reserved')
     def __init__(self, data, span_spec=None, align_spec=None, style=None):
         self.data = data
         self.span, self.vspan = Table.parse_span_spec(span_spec)
@@ -3155,8 +3673,9 @@ class Table(AbstractBlock):
         # Calculated parameters.
         self.abswidth=None      # 1..   (page units).
         self.pcwidth = None     # 1..99 (percentage).
-        self.rows=[]            # Parsed rows, each row is a list of Cells.
         self.columns=[]         # List of Columns.
+        self.resolved={}        # resolve_style() results keyed by style id.
+        self.celltags={}        # Substituted cell tags, see subs_row().
     @staticmethod
     def parse_align_spec(align_spec):
         """
@@ -3258,7 +3777,19 @@ class Table(AbstractBlock):
         tags = self.get_param('tags',params)
         assert(tags and tags in tables.tags)
         return tables.tags[tags]
-    def get_style(self,prefix):
+    def resolve_style(self,style):
+        """
+        Return (tags,presubs,postsubs,filter) tuple for cells with style
+        dictionary 'style'.
+        """
+        result = self.resolved.get(id(style))
+        if result is None:
+            presubs,postsubs = self.get_subs(style)
+            result = (self.get_tags(style), presubs, postsubs,
+                      self.get_param('filter',style))
+            self.resolved[id(style)] = result
+        return result
+    def get_style(self,prefix,quiet=False):
         """
         Return the style dictionary whose name starts with 'prefix'.
         """
@@ -3270,7 +3801,8 @@ class Table(AbstractBlock):
             if name.startswith(prefix):
                 return self.styles[name]
         else:
-            self.error('missing style: %s*' % prefix)
+            if not quiet:
+                self.error('missing style: %s*' % prefix)
             return None
     def parse_cols(self, cols, halign, valign):
         """
@@ -3354,8 +3886,11 @@ class Table(AbstractBlock):
         """
         cols = []
         i = 1
+        self.resolved = {}
+        self.celltags = {}
         for col in self.columns:
-            colspec = self.get_tags(col.style).colspec
+            col.resolved = self.resolve_style(col.style)
+            colspec = col.resolved[0].colspec
             if colspec:
                 self.attributes['halign'] = col.halign
                 self.attributes['valign'] = col.valign
@@ -3370,19 +3905,19 @@ class Table(AbstractBlock):
             i += 1
         if cols:
             self.attributes['colspecs'] = writer.newline.join(cols)
-    def parse_rows(self, text):
+    def iter_rows(self, text, quiet=False):
         """
-        Parse the table source text into self.rows (a list of rows, each row
-        is a list of Cells.
+        Generate the rows (each row is a list of Cells) parsed from the table
+        source text. Only the cells reserved by active row spans are kept. If
+        'quiet' is True parse errors are not reported.
         """
-        reserved = {}  # Reserved cells generated by rowspans.
         if self.parameters.format in ('psv','dsv'):
             colcount = len(self.columns)
-            parsed_cells = self.parse_psv_dsv(text)
+            cells = self.iter_psv_dsv(text, quiet)
+            reserved = {}  # Reserved cells generated by rowspans.
             ri = 0  # Current row index 0..
             ci = 0  # Column counter 0..colcount
             row = []
-            i = 0
             while True:
                 resv = reserved.get(ri) and reserved[ri].get(ci)
                 if resv:
@@ -3391,10 +3926,9 @@ class Table(AbstractBlock):
                     # cell.
                     cell = resv
                 else:
-                    if i >= len(parsed_cells):
+                    cell = next(cells, None)
+                    if cell is None:
                         break   # No more parsed or reserved cells.
-                    cell = parsed_cells[i]
-                    i += 1
                     if cell.vspan > 1:
                         # Generate ensuing reserved cells spanned vertically by
                         # the current cell.
@@ -3406,39 +3940,78 @@ class Table(AbstractBlock):
                 if ci <= colcount:
                     row.append(cell)
                 if ci >= colcount:
-                    self.rows.append(row)
+                    yield row
+                    reserved.pop(ri, None)
                     ri += 1
                     row = []
                     ci = 0
         elif self.parameters.format == 'csv':
-            self.rows = self.parse_csv(text)
+            for row in self.iter_csv(text, quiet):
+                yield row
         else:
             assert True,'illegal table format'
-        # Check for empty rows containing only reserved (spanned) cells.
-        for ri,row in enumerate(self.rows):
+    def check_rows(self, rows, empty_rows, span_rows):
+        """
+        Generate the rows checking them as they pass. The numbers of rows
+        containing only reserved (spanned) cells are appended to 'empty_rows'
+        and (row number,message) tuples of rows with bad spans to 'span_rows'.
+        """
+        for ri,row in enumerate(rows):
             empty = True
             for cell in row:
                 if not cell.reserved:
                     empty = False
                     break
             if empty:
-                message.warning('table row %d: empty spanned row' % (ri+1))
-        # Check that all row spans match.
-        for ri,row in enumerate(self.rows):
+                empty_rows.append(ri)
+            # Check that all row spans match.
             row_span = 0
             for cell in row:
                 row_span += cell.span
             if ri == 0:
                 header_span = row_span
             if row_span < header_span:
-                message.warning('table row %d: does not span all columns' % (ri+1))
+                span_rows.append((ri, 'does not span all columns'))
             if row_span > header_span:
-                message.warning('table row %d: exceeds columns span' % (ri+1))
+                span_rows.append((ri, 'exceeds columns span'))
+            yield row
+    def warn_rows(self, empty_rows, span_rows):
+        """
+        Report the row problems found by check_rows().
+        """
+        for ri in empty_rows:
+            message.warning('table row %d: empty spanned row' % (ri+1))
+        for ri,msg in span_rows:
+            message.warning('table row %d: %s' % (ri+1, msg))
+    def count_first(self, template):
+        """
+        Return True if the rows have to be counted before the table markup
+        'template' can be written: it uses the 'rowcount' attribute or it
+        places the footer row ahead of the body rows.
+        """
+        template = '\n'.join(template)
+        if '{rowcount' in template:
+            return True
+        if 'footer' in self.parameters.options:
+            i = template.find('{footrows}')
+            return 0 <= i < template.find('{bodyrows}')
+        return False
     def subs_rows(self, rows, rowtype='body'):
         """
         Return a string of output markup from a list of rows, each row
         is a list of raw data text.
         """
+        result = []
+        stag,etag = self.subs_row_tag(rowtype)
+        for row in rows:
+            result.append(stag)
+            result += self.subs_row(row,rowtype)
+            result.append(etag)
+        return writer.newline.join(result)
+    def subs_row_tag(self, rowtype):
+        """
+        Return the substituted (start,end) row tags for 'rowtype' rows.
+        """
         tags = tables.tags[self.parameters.tags]
         if rowtype == 'header':
             rtag = tags.headrow
@@ -3446,13 +4019,7 @@ class Table(AbstractBlock):
             rtag = tags.footrow
         else:
             rtag = tags.bodyrow
-        result = []
-        stag,etag = subs_tag(rtag,self.attributes)
-        for row in rows:
-            result.append(stag)
-            result += self.subs_row(row,rowtype)
-            result.append(etag)
-        return writer.newline.join(result)
+        return subs_tag(rtag,self.attributes)
     def subs_row(self, row, rowtype):
         """
         Substitute the list of Cells using the data tag.
@@ -3460,6 +4027,12 @@ class Table(AbstractBlock):
         """
         result = []
         i = 0
+        if rowtype == 'header':
+            dtag = 'headdata'
+        elif rowtype == 'footer':
+            dtag = 'footdata'
+        else:
+            dtag = 'bodydata'
         for cell in row:
             if cell.reserved:
                 # Skip vertically spanned placeholders.
@@ -3468,124 +4041,140 @@ class Table(AbstractBlock):
             if i >= len(self.columns):
                 break   # Skip cells outside the header width.
             col = self.columns[i]
-            self.attributes['halign'] = cell.halign or col.halign
-            self.attributes['valign'] = cell.valign or  col.valign
-            self.attributes['colabswidth'] = col.abswidth
-            self.attributes['colpcwidth'] = col.pcwidth
-            self.attributes['colnumber'] = str(i+1)
-            self.attributes['colspan'] = str(cell.span)
-            self.attributes['colstart'] = self.attributes['colnumber']
-            self.attributes['colend'] = str(i+cell.span)
-            self.attributes['rowspan'] = str(cell.vspan)
-            self.attributes['morerows'] = str(cell.vspan-1)
-            # Fill missing column data with blanks.
-            if i > len(self.columns) - 1:
-                data = ''
-            else:
-                data = cell.data
             if rowtype == 'header':
                 # Use table style unless overriden by cell style.
                 colstyle = cell.style
             else:
                 # If the cell style is not defined use the column style.
                 colstyle = cell.style or col.style
-            tags = self.get_tags(colstyle)
-            presubs,postsubs = self.get_subs(colstyle)
+            if colstyle is col.style:
+                tags,presubs,postsubs,filters = col.resolved
+            else:
+                tags,presubs,postsubs,filters = self.resolve_style(colstyle)
+            # The cell tags only depend on the cell attributes set below so
+            # they are substituted once per distinct cell layout.
+            key = (i, cell.span, cell.vspan, cell.halign, cell.valign,
+                   id(tags), dtag)
+            celltags = self.celltags.get(key)
+            if celltags is None or filters:
+                self.attributes['halign'] = cell.halign or col.halign
+                self.attributes['valign'] = cell.valign or  col.valign
+                self.attributes['colabswidth'] = col.abswidth
+                self.attributes['colpcwidth'] = col.pcwidth
+                self.attributes['colnumber'] = str(i+1)
+                self.attributes['colspan'] = str(cell.span)
+                self.attributes['colstart'] = self.attributes['colnumber']
+                self.attributes['colend'] = str(i+cell.span)
+                self.attributes['rowspan'] = str(cell.vspan)
+                self.attributes['morerows'] = str(cell.vspan-1)
+            if celltags is None:
+                if rowtype != 'header' and tags.paragraph:
+                    ptags = subs_tag(tags.paragraph,self.attributes)
+                else:
+                    ptags = None
+                dtags = subs_tag(getattr(tags,dtag),self.attributes)
+                celltags = (ptags,dtags)
+                # Dropped tags are not cached so they are reported for every
+                # cell.
+                if dtags[0] is not None and (not ptags or ptags[0] is not None):
+                    self.celltags[key] = celltags
+            # Fill missing column data with blanks.
+            if i > len(self.columns) - 1:
+                data = ''
+            else:
+                data = cell.data
             data = [data]
             data = Lex.subs(data, presubs)
-            data = filter_lines(self.get_param('filter',colstyle),
-                                data, self.attributes)
+            data = filter_lines(filters, data, self.attributes)
             data = Lex.subs(data, postsubs)
-            if rowtype != 'header':
-                ptag = tags.paragraph
-                if ptag:
-                    stag,etag = subs_tag(ptag,self.attributes)
-                    text = '\n'.join(data).strip()
-                    data = []
-                    for para in re.split(r'\n{2,}',text):
-                        data += dovetail_tags([stag],para.split('\n'),[etag])
-            if rowtype == 'header':
-                dtag = tags.headdata
-            elif rowtype == 'footer':
-                dtag = tags.footdata
-            else:
-                dtag = tags.bodydata
-            stag,etag = subs_tag(dtag,self.attributes)
-            result = result + dovetail_tags([stag],data,[etag])
+            ptags,dtags = celltags
+            if ptags:
+                stag,etag = ptags
+                text = '\n'.join(data).strip()
+                data = []
+                for para in re.split(r'\n{2,}',text):
+                    data += dovetail_tags([stag],para.split('\n'),[etag])
+            stag,etag = dtags
+            result += dovetail_tags([stag],data,[etag])
             i += cell.span
         return result
-    def parse_csv(self,text):
+    def iter_csv(self,text,quiet=False):
         """
-        Parse the table source text and return a list of rows, each row
-        is a list of Cells.
+        Generate the rows (each row is a list of Cells) parsed from CSV table
+        source text.
         """
         import StringIO
         import csv
-        rows = []
         rdr = csv.reader(StringIO.StringIO('\r\n'.join(text)),
                      delimiter=self.parameters.separator, skipinitialspace=True)
         try:
             for row in rdr:
-                rows.append([Cell(data) for data in row])
+                yield [Cell(data) for data in row]
         except Exception:
-            self.error('csv parse error: %s' % row)
-        return rows
+            if not quiet:
+                self.error('csv parse error: %s' % row)
     def parse_psv_dsv(self,text):
         """
         Parse list of PSV or DSV table source text lines and return a list of
         Cells.
         """
-        def append_cell(data, span_spec, op, align_spec, style):
+        return list(self.iter_psv_dsv(text))
+    def iter_psv_dsv(self,text,quiet=False):
+        """
+        Generate the Cells parsed from list of PSV or DSV table source text
+        lines.
+        """
+        def fields():
+            # Generate (data,span,op,align,style) separated fields.
+            start = 0
+            span = None
+            op = None
+            align = None
+            style = None
+            data = ''
+            for mo in re.finditer(separator,text):
+                data += text[start:mo.start()]
+                if data.endswith('\\'):
+                    data = data[:-1]+mo.group() # Reinstate escaped separators.
+                else:
+                    yield (data, span, op, align, style)
+                    span = mo.groupdict().get('span')
+                    op = mo.groupdict().get('op')
+                    align = mo.groupdict().get('align')
+                    style = mo.groupdict().get('style')
+                    if style:
+                        style = self.get_style(style,quiet)
+                    data = ''
+                start = mo.end()
+            # Last cell follows final separator.
+            data += text[start:]
+            yield (data, span, op, align, style)
+        text = '\n'.join(text)
+        separator = '(?msu)'+self.parameters.separator
+        # We expect a dummy blank item preceeding first PSV cell.
+        leading = self.parameters.format == 'psv'
+        for data, span_spec, op, align_spec, style in fields():
+            if leading:
+                leading = False
+                if data.strip() == '':
+                    continue
+                if not quiet:
+                    self.error('missing leading separator: %s' % separator,
+                            self.start)
             op = op or '+'
             if op == '*':   # Cell multiplier.
                 span = Table.parse_span_spec(span_spec)[0]
                 for i in range(span):
-                    cells.append(Cell(data, '1', align_spec, style))
+                    yield Cell(data, '1', align_spec, style)
             elif op == '+': # Column spanner.
-                cells.append(Cell(data, span_spec, align_spec, style))
-            else:
+                yield Cell(data, span_spec, align_spec, style)
+            elif not quiet:
                 self.error('illegal table cell operator')
-        text = '\n'.join(text)
-        separator = '(?msu)'+self.parameters.separator
-        format = self.parameters.format
-        start = 0
-        span = None
-        op = None
-        align = None
-        style = None
-        cells = []
-        data = ''
-        for mo in re.finditer(separator,text):
-            data += text[start:mo.start()]
-            if data.endswith('\\'):
-                data = data[:-1]+mo.group() # Reinstate escaped separators.
-            else:
-                append_cell(data, span, op, align, style)
-                span = mo.groupdict().get('span')
-                op = mo.groupdict().get('op')
-                align = mo.groupdict().get('align')
-                style = mo.groupdict().get('style')
-                if style:
-                    style = self.get_style(style)
-                data = ''
-            start = mo.end()
-        # Last cell follows final separator.
-        data += text[start:]
-        append_cell(data, span, op, align, style)
-        # We expect a dummy blank item preceeding first PSV cell.
-        if format == 'psv':
-            if cells[0].data.strip() != '':
-                self.error('missing leading separator: %s' % separator,
-                        self.start)
-            else:
-                cells.pop(0)
-        return cells
     def translate(self):
         AbstractBlock.translate(self)
         reader.read()   # Discard delimiter.
         # Reset instance specific properties.
         self.columns = []
-        self.rows = []
         attrs = {}
         BlockTitle.consume(attrs)
         # Mix in document attribute list.
@@ -3621,9 +4210,32 @@ class Table(AbstractBlock):
         # Set calculated attributes.
         self.attributes['colcount'] = len(self.columns)
         self.build_colspecs()
-        self.parse_rows(text)
-        # The 'rowcount' attribute is used by the experimental LaTeX backend.
-        self.attributes['rowcount'] = str(len(self.rows))
+        for option in self.parameters.options:
+            self.attributes[option+'-option'] = ''
+        template = config.sections[self.parameters.template]
+        empty_rows = []
+        span_rows = []
+        rows = self.check_rows(self.iter_rows(text), empty_rows, span_rows)
+        # The rows are parsed in a single pass and written as they are
+        # substituted unless they have to be counted first.
+        last = None
+        counted = self.count_first(template)
+        if counted:
+            # Count the rows ('rowcount' is used by the experimental LaTeX
+            # backend) and find the footer row, the rows are then parsed again
+            # quietly so errors are not reported twice.
+            rowcount = 0
+            for last in rows:
+                rowcount += 1
+            self.attributes['rowcount'] = str(rowcount)
+            self.warn_rows(empty_rows, span_rows)
+            rows = self.iter_rows(text, quiet=True)
+        # Read ahead enough rows to tell the header, footer and body apart.
+        ahead = []
+        for row in rows:
+            ahead.append(row)
+            if len(ahead) == 3:
+                break
         # Generate headrows, footrows, bodyrows.
         # Headrow, footrow and bodyrow data replaces same named attributes in
         # the table markup template. In order to ensure this data does not get
@@ -3631,22 +4243,22 @@ class Table(AbstractBlock):
         # already substituted inline passthroughs) unique placeholders are used
         # (the tab character does not appear elsewhere since it is expanded on
         # input) which are replaced after template attribute substitution.
-        headrows = footrows = bodyrows = None
-        for option in self.parameters.options:
-            self.attributes[option+'-option'] = ''
-        if self.rows and 'header' in self.parameters.options:
-            headrows = self.subs_rows(self.rows[0:1],'header')
+        headrows = footrows = None
+        footer = False
+        if ahead and 'header' in self.parameters.options:
+            headrows = self.subs_rows([ahead.pop(0)],'header')
             self.attributes['headrows'] = '\x07headrows\x07'
-            self.rows = self.rows[1:]
-        if self.rows and 'footer' in self.parameters.options:
-            footrows = self.subs_rows( self.rows[-1:], 'footer')
+        if ahead and 'footer' in self.parameters.options:
+            footer = True
+            if len(ahead) == 1:
+                last = ahead.pop()
+            if last is not None:
+                footrows = self.subs_rows([last],'footer')
             self.attributes['footrows'] = '\x07footrows\x07'
-            self.rows = self.rows[:-1]
-        if self.rows:
-            bodyrows = self.subs_rows(self.rows)
+        if ahead:
+            bodytags = self.subs_row_tag('body')
             self.attributes['bodyrows'] = '\x07bodyrows\x07'
-        table = subs_attrs(config.sections[self.parameters.template],
-                           self.attributes)
+        table = subs_attrs(template, self.attributes)
         table = writer.newline.join(table)
         # Before we finish replace the table head, foot and body place holders
         # with the real data.
@@ -3654,10 +4266,62 @@ class Table(AbstractBlock):
             table = table.replace('\x07headrows\x07', headrows, 1)
         if footrows:
             table = table.replace('\x07footrows\x07', footrows, 1)
-        if bodyrows:
-            table = table.replace('\x07bodyrows\x07', bodyrows, 1)
-        writer.write(table,trace='table')
+        if ahead:
+            self.write_body(table, ahead, rows, bodytags, footer)
+        else:
+            writer.write(table,trace='table')
+        if not counted:
+            self.warn_rows(empty_rows, span_rows)
         self.pop_blockname()
+    def write_body(self, table, ahead, rest, bodytags, footer):
+        """
+        Write the table markup replacing the body placeholder with the 'ahead'
+        rows followed by the 'rest' rows. If 'footer' is True the last row is
+        held back and replaces the footer placeholder if it is still there.
+        If the body placeholder is on a line of its own the rows are written
+        as they are substituted.
+        """
+        last = []
+        def rows():
+            # Keep one row of lookahead so the last row is not written.
+            prev = None
+            for row in ahead:
+                if prev is not None:
+                    yield prev
+                prev = row
+            for row in rest:
+                yield prev
+                prev = row
+            if footer:
+                last.append(prev)
+            else:
+                yield prev
+        def footrows(table):
+            if footer and '\x07footrows\x07' in table:
+                table = table.replace('\x07footrows\x07',
+                                      self.subs_rows(last,'footer'), 1)
+            return table
+        newline = writer.newline
+        placeholder = '\x07bodyrows\x07'
+        i = table.find(placeholder)
+        before = table[:i]
+        after = table[i+len(placeholder):]
+        if i < 0 or not before.endswith(newline) \
+                or not after.startswith(newline):
+            result = []
+            stag,etag = bodytags
+            for row in rows():
+                result.append(stag)
+                result += self.subs_row(row,'body')
+                result.append(etag)
+            table = table.replace(placeholder, newline.join(result), 1)
+            writer.write(footrows(table),trace='table')
+            return
+        writer.write(before[:-len(newline)],trace='table')
+        stag,etag = bodytags
+        for row in rows():
+            writer.write(newline.join([stag] + self.subs_row(row,'body') + [etag]))
+        writer.write(footrows(after[len(newline):]))
 
 class Tables(AbstractBlocks):
     """List of tables."""
@@ -3739,6 +4403,9 @@ class Macros:
     # Default system macro syntax.
     SYS_RE = r'(?u)^(?P<name>[\\]?\w(\w|-)*?)::(?P<target>\S*?)' + \
              r'(\[(?P<attrlist>.*?)\])$'
+    SYSTEM_CACHE_SIZE = 1000    # Maximum memoized system macro lines.
+    PASSTHROUGH_RE = re.compile('\x07(\\d+)\x07') # Passthrough placeholder.
+    name_reos = {}              # Compiled match() macro name patterns.
     def __init__(self):
         self.macros = []        # List of Macros.
         self.current = None     # The last matched block macro.
@@ -3748,7 +4415,49 @@ class Macros:
         m.pattern = self.SYS_RE
         m.prefix = '+'
         m.reo = re.compile(m.pattern)
+        m.literals = re_literals(m.pattern)
         self.macros.append(m)
+        self.reset_caches()
+    def __getstate__(self):
+        # Memoized match objects are not part of the configuration.
+        state = self.__dict__.copy()
+        state['system_matches'] = {}
+        return state
+    def reset_caches(self):
+        """Forget memoized system macro matches, find the literal strings
+        (e.g. '::') contained in all system macros and build the scanners
+        used to skip text no inline or block macro can match."""
+        self.system_matches = {}    # System macro matches keyed by line.
+        literals = None
+        for m in self.macros:
+            if m.prefix == '+':
+                if literals is None:
+                    literals = set(m.literals)
+                else:
+                    literals &= set(m.literals)
+        self.system_literals = tuple(literals or ())
+        # Combined macro prefilters keyed by (prefix,passthroughs).
+        self.scanners = {}
+        for prefix in ('','#'):
+            for passthroughs in (False,True):
+                words = []
+                for m in self.macros:
+                    if m.prefix != prefix:
+                        continue
+                    if passthroughs and not m.has_passthrough():
+                        continue
+                    if not m.literals:
+                        break
+                    words.append(max(m.literals, key=len))
+                else:
+                    if words:
+                        self.scanners[(prefix,passthroughs)] = re.compile(
+                            '|'.join([re.escape(w) for w in set(words)]))
+    def scan(self,text,prefix='',passthroughs=False):
+        """Return False if no macro with prefix 'prefix' (passthrough macros
+        if 'passthroughs' is True) can match 'text'."""
+        reo = self.scanners.get((prefix,passthroughs))
+        return reo is None or reo.search(text) is not None
     def load(self,entries):
         for entry in entries:
             m = Macro()
@@ -3769,6 +4478,7 @@ class Macros:
                         break
                 else:
                     self.macros.append(m)
+        self.reset_caches()
     def dump(self):
         write = lambda s: sys.stdout.write('%s%s' % (s,writer.newline))
         write('[macros]')
@@ -3790,18 +4500,21 @@ class Macros:
         # If callouts is True then only callout macros are processed, if False
         # then all non-callout macros are processed.
         result = text
+        if not self.scan(result,prefix):
+            return result
         for m in self.macros:
             if m.prefix == prefix:
                 if callouts ^ (m.name != 'callout'):
-                    result = m.subs(result)
+                    if m.prefilter(result):
+                        result = m.subs(result)
         return result
     def isnext(self):
         """Return matching macro if block macro is next on reader."""
         reader.skip_blank_lines()
         line = reader.read_next()
-        if line:
+        if line and self.scan(line,'#'):
             for m in self.macros:
-                if m.prefix == '#':
+                if m.prefix == '#' and m.prefilter(line):
                     if m.reo.match(line):
                         self.current = m
                         return m
@@ -3809,29 +4522,70 @@ class Macros:
     def match(self,prefix,name,text):
         """Return re match object matching 'text' with macro type 'prefix',
         macro name 'name'."""
-        for m in self.macros:
-            if m.prefix == prefix:
-                mo = m.reo.match(text)
-                if mo:
-                    if m.name == name:
-                        return mo
-                    if re.match(name, mo.group('name')):
-                        return mo
+        if prefix == '+':
+            matches = self.match_system(text)
+        else:
+            matches = ((m.name,m.reo.match(text)) for m in self.macros
+                    if m.prefix == prefix)
+        for macro_name,mo in matches:
+            if mo:
+                if macro_name == name:
+                    return mo
+                reo = self.name_reos.get(name)
+                if reo is None:
+                    reo = self.name_reos[name] = re.compile(name)
+                if reo.match(mo.group('name')):
+                    return mo
         return None
+    def match_system(self,text):
+        """Return list of (name,match) pairs of the system macros matching
+        'text'. Lines are classified once: the reader matches each line
+        against several system macro names and peeks at it repeatedly."""
+        for s in self.system_literals:
+            if s not in text:
+                return ()
+        result = self.system_matches.get(text)
+        if result is None:
+            result = []
+            for m in self.macros:
+                if m.prefix == '+':
+                    mo = m.reo.match(text)
+                    if mo:
+                        result.append((m.name,mo))
+            if len(self.system_matches) >= self.SYSTEM_CACHE_SIZE:
+                self.system_matches.clear()
+            self.system_matches[text] = result
+        return result
     def extract_passthroughs(self,text,prefix=''):
         """ Extract the passthrough text and replace with temporary
         placeholders."""
         self.passthroughs = []
+        if not self.scan(text,prefix,passthroughs=True):
+            return text
         for m in self.macros:
             if m.has_passthrough() and m.prefix == prefix:
-                text = m.subs_passthroughs(text, self.passthroughs)
+                if m.prefilter(text):
+                    text = m.subs_passthroughs(text, self.passthroughs)
         return text
     def restore_passthroughs(self,text):
         """ Replace passthough placeholders with the original passthrough
         text."""
-        for i,v in enumerate(self.passthroughs):
-            text = text.replace('\x07'+str(i)+'\x07', self.passthroughs[i])
-        return text
+        passthroughs = self.passthroughs
+        if not passthroughs:
+            return text
+        def restore(text, index):
+            # Placeholders in passthrough 'index' that refer to later
+            # passthroughs are restored too.
+            def subs_func(mo):
+                i = int(mo.group(1))
+                if index < i < len(passthroughs):
+                    result = passthroughs[i]
+                    if '\x07' in result:
+                        result = restore(result, i)
+                    return result
+                return mo.group()
+            return self.PASSTHROUGH_RE.sub(subs_func, text)
+        return restore(text, -1)
 
 class Macro:
     def __init__(self):
@@ -3840,8 +4594,15 @@ class Macro:
         self.prefix = ''        # '' if inline, '+' if system, '#' if block.
         self.reo = None         # Compiled pattern re object.
         self.subslist = []      # Default subs for macros passtext group.
+        self.literals = []      # Strings all pattern matches contain.
     def has_passthrough(self):
         return self.pattern.find(r'(?P<passtext>') >= 0
+    def prefilter(self,text):
+        """Return False if the macro pattern cannot match 'text'."""
+        for s in self.literals:
+            if s not in text:
+                return False
+        return True
     def section_name(self,name=None):
         """Return macro markup template section name based on macro name and
         prefix.  Return None section not found."""
@@ -3884,6 +4645,7 @@ class Macro:
                                  'illegal subs in macro entry: %s' % entry)
         self.pattern = pattern
         self.reo = re.compile(pattern)
+        self.literals = re_literals(pattern)
         self.prefix = prefix
         self.name = name
         self.subslist = subslist or []
@@ -4086,9 +4848,11 @@ class Reader1:
     def __init__(self):
         self.f = None           # Input file object.
         self.fname = None       # Input file name.
-        self.next = []          # Read ahead buffer containing
-                                # [filename,linenumber,linetext] lists.
-        self.cursor = None      # Last read() [filename,linenumber,linetext].
+        self.stdin = None       # <stdin> file object (API call).
+        self.next = deque()     # Read ahead buffer containing
+                                # (filename,linenumber,linetext) tuples.
+        self.cursor = None      # Last read() (filename,linenumber,linetext).
+        self.peeked = None      # Buffered cursor last returned by read_next().
         self.tabsize = 8        # Tab expansion number of spaces.
         self.parent = None      # Included reader's parent reader.
         self._lineno = 0        # The last line read from file object f.
@@ -4101,7 +4865,7 @@ class Reader1:
         self.fname = fname
         message.verbose('reading: '+fname)
         if fname == '<stdin>':
-            self.f = sys.stdin
+            self.f = self.stdin or sys.stdin
             self.infile = None
             self.indir = None
         else:
@@ -4111,18 +4875,19 @@ class Reader1:
         document.attributes['infile'] = self.infile
         document.attributes['indir'] = self.indir
         self._lineno = 0            # The last line read from file object f.
-        self.next = []
+        self.next = deque()
         # Prefill buffer by reading the first line and then pushing it back.
         if Reader1.read(self):
             if self.cursor[2].startswith(UTF8_BOM):
-                self.cursor[2] = self.cursor[2][len(UTF8_BOM):]
+                self.cursor = self.cursor[:2] + \
+                        (self.cursor[2][len(UTF8_BOM):],)
                 self.bom = UTF8_BOM
             self.unread(self.cursor)
             self.cursor = None
     def closefile(self):
         """Used by class methods to close nested include files."""
         self.f.close()
-        self.next = []
+        self.next = deque()
     def close(self):
         self.closefile()
         self.__init__()
@@ -4139,7 +4904,7 @@ class Reader1:
                 if self.tabsize != 0:
                     s = s.expandtabs(self.tabsize)
                 s = s.rstrip()
-                self.next.append([self.fname,self._lineno,s])
+                self.next.append((self.fname,self._lineno,s))
                 if len(self.next) > self.READ_BUFFER_MIN:
                     break
                 s = self.f.readline()
@@ -4147,8 +4912,7 @@ class Reader1:
                     self._lineno = self._lineno + 1
         # Return first (oldest) buffer entry.
         if len(self.next) > 0:
-            self.cursor = self.next[0]
-            del self.next[0]
+            self.cursor = self.next.popleft()
             result = self.cursor[2]
             # Check for include macro.
             mo = macros.match('+',r'^include[1]?$',result)
@@ -4161,6 +4925,13 @@ class Reader1:
                 if self.current_depth >= self.max_depth:
                     message.warning('maximum include depth exceeded')
                     return result
+                if '{' in mo.group('target'):
+                    if sectcache.replaying:
+                        # Leave the macro to be processed by the section
+                        # translation.
+                        Reader1.unread(self,self.cursor)
+                        return None
+                    sectcache.volatile()
                 # Perform attribute substitution on include macro file name.
                 fname = subs_attrs(mo.group('target'))
                 if not fname:
@@ -4170,10 +4941,11 @@ class Reader1:
                     fname = safe_filename(fname, os.path.dirname(self.fname))
                     if not fname:
                         return Reader1.read(self)   # Return next input line.
-                    if not os.path.isfile(fname):
+                    if not confcache.isfile(fname):
                         if warnings:
                             message.warning('include file not found: %s' % fname)
                         return Reader1.read(self)   # Return next input line.
+                    document.depend(fname)
                     if mo.group('name') == 'include1':
                         if not config.dumping:
                             if fname not in config.include1:
@@ -4250,7 +5022,7 @@ class Reader1:
         buffer. Note that it's up to the caller to restore the previous
         cursor."""
         assert cursor
-        self.next.insert(0,cursor)
+        self.next.appendleft(cursor)
 
 class Reader(Reader1):
     """ Wraps (well, sought of) Reader1 class and implements conditional text
@@ -4270,6 +5042,11 @@ class Reader(Reader1):
         result = self.read_super()
         if result is None:
             return None
+        if sectcache.replaying and \
+                macros.match('+',r'ifdef|ifndef|ifeval|endif|eval|sys|sys2',result):
+            # Leave the macro to be processed by the section translation.
+            Reader1.unread(self,self.cursor)
+            return None
         while self.skip:
             mo = macros.match('+',r'ifdef|ifndef|ifeval|endif',result)
             if mo:
@@ -4299,6 +5076,7 @@ class Reader(Reader1):
                 return None
         mo = macros.match('+',r'ifdef|ifndef|ifeval|endif',result)
         if mo:
+            sectcache.volatile()
             name = mo.group('name')
             target = mo.group('target')
             attrlist = mo.group('attrlist')
@@ -4346,20 +5124,39 @@ class Reader(Reader1):
                 action = mo.group('name')
                 cmd = mo.group('attrlist')
                 result = system(action, cmd, is_macro=True)
-                self.cursor[2] = result  # So we don't re-evaluate.
+                # So we don't re-evaluate.
+                self.cursor = self.cursor[:2] + (result,)
         if result:
             # Unescape escaped system macros.
             if macros.match('+',r'\\eval|\\sys|\\sys2|\\ifdef|\\ifndef|\\endif|\\include|\\include1',result):
                 result = result[1:]
+        cursors = sectcache.cursors
+        if result is not None and cursors is not None:
+            # Conditional inclusion macros read (and record) recursively.
+            if not cursors or cursors[-1] is not self.cursor:
+                cursors.append(self.cursor)
         return result
+    def unread(self,cursor):
+        cursors = sectcache.cursors
+        if cursors and cursors[-1] is cursor:
+            del cursors[-1]
+        Reader1.unread(self,cursor)
     def eof(self):
         return self.read_next() is None
     def read_next(self):
+        next = self.next
+        if next and next[0] is self.peeked:
+            # Unchanged since the last peek and not a macro.
+            return self.peeked[2]
         save_cursor = self.cursor
         result = self.read()
         if result is not None:
             self.unread(self.cursor)
             self.cursor = save_cursor
+            # Lines without macros read back unchanged so the next peek can be
+            # answered from the buffer.
+            if '::' not in result and self.next[0][2] == result:
+                self.peeked = self.next[0]
         return result
     def read_lines(self,count=1):
         """Return tuple containing count lines."""
@@ -4400,26 +5197,32 @@ class Reader(Reader1):
                 terminators = [re.compile(terminators)]
             else:
                 terminators = [terminators]
-        while not self.eof():
-            save_cursor = self.cursor
-            s = self.read()
-            if not same_file or fname == self.cursor[0]:
+        while True:
+            # Test the terminators against the peeked line so it need not be
+            # pushed back.
+            s = self.read_next()
+            if s is None:
+                break
+            if not same_file or fname == self.next[0][0]:
                 for reo in terminators:
                     if reo.match(s):
-                        self.unread(self.cursor)
-                        self.cursor = save_cursor
                         return tuple(result)
-            result.append(s)
+            result.append(self.read())
         return tuple(result)
 
 class Writer:
     """Writes lines to output file."""
+    BUFFER_SIZE = 16384     # Output is written in blocks of this size.
     def __init__(self):
         self.newline = '\r\n'            # End of line terminator.
         self.f = None                    # Output file object.
         self.fname = None                # Output file name.
+        self.stdout = None               # <stdout> file object (API call).
         self.lines_out = 0               # Number of lines written.
         self.skip_blank_lines = False    # If True don't output blank lines.
+        self.buffer = []                 # Lines not yet written to self.f.
+        self.buffered = 0                # Length of buffered lines.
+        self.recorded = None             # If not None records written lines.
     def open(self,fname,bom=None):
         '''
         bom is optional byte order mark.
@@ -4427,20 +5230,50 @@ class Writer:
         '''
         self.fname = fname
         if fname == '<stdout>':
-            self.f = sys.stdout
+            self.f = self.stdout or sys.stdout
         else:
             self.f = open(fname,'wb+')
         message.verbose('writing: '+writer.fname,False)
         if bom:
             self.f.write(bom)
         self.lines_out = 0
+        self.buffer = []
+        self.buffered = 0
+    def flush(self):
+        """Write buffered lines to the output file."""
+        if self.buffer:
+            try:
+                s = ''.join(self.buffer)
+            except UnicodeError:
+                # Mixed unicode and encoded lines, write them separately.
+                for s in self.buffer:
+                    self.f.write(s)
+            else:
+                self.f.write(s)
+            self.buffer = []
+            self.buffered = 0
     def close(self):
+        self.flush()
         if self.fname != '<stdout>':
             self.f.close()
     def write_line(self, line=None):
         if not (self.skip_blank_lines and (not line or not line.strip())):
-            self.f.write((line or '') + self.newline)
+            line = (line or '') + self.newline
+            self.buffer.append(line)
+            self.buffered += len(line)
+            if self.recorded is not None:
+                self.recorded.append(line)
+            if self.buffered >= self.BUFFER_SIZE:
+                self.flush()
             self.lines_out = self.lines_out + 1
+    def write_recorded(self, lines, count):
+        """Write newline terminated lines recorded by write_line(), count is
+        the number of lines they were counted as."""
+        self.buffer.extend(lines)
+        self.buffered += sum(map(len, lines))
+        if self.buffered >= self.BUFFER_SIZE:
+            self.flush()
+        self.lines_out = self.lines_out + count
     def write(self,*args,**kwargs):
         """Iterates arguments, writes tuple and list arguments one line per
         element, else writes argument as single line. If no arguments writes
@@ -4482,7 +5315,15 @@ def _subs_specialwords(mo):
     """Special word substitution function called by
     Config.subs_specialwords()."""
     word = mo.re.pattern                    # The special word.
-    template = config.specialwords[word]    # The corresponding markup template.
+    return _subs_specialword(mo, config.specialwords[word])
+
+def _subs_literal_specialwords(mo):
+    """Literal special word substitution function called by
+    Config.subs_specialwords()."""
+    return _subs_specialword(mo, config.specialwords[mo.group()])
+
+def _subs_specialword(mo, template):
+    """Substitute special word match 'mo' using markup 'template'."""
     if not template in config.sections:
         raise EAsciiDoc,'missing special word template [%s]' % template
     if mo.group()[0] == '\\':
@@ -4529,13 +5370,17 @@ class Config:
         self.tags = {}          # Values contain (stag,etag) tuples.
         self.specialchars = {}  # Values of special character substitutions.
         self.specialwords = {}  # Name is special word pattern, value is macro.
+        self.specialword_reos = None    # See compile_specialwords().
         self.replacements = OrderedDict()   # Key is find pattern, value is
                                             #replace pattern.
         self.replacements2 = OrderedDict()
         self.replacements3 = OrderedDict()
+        self.replacement_reos = {}  # Compiled replacements keyed by section
+                                    # (see compile_replacements()).
         self.specialsections = {} # Name is special section name pattern, value
                                   # is corresponding section name.
         self.quotes = OrderedDict()    # Values contain corresponding tag name.
+        self.quote_reos = None  # Compiled quotes (see compile_quotes()).
         self.fname = ''         # Most recently loaded configuration file name.
         self.conf_attrs = {}    # Attributes entries from conf files.
         self.cmd_attrs = {}     # Attributes from command-line -a options.
@@ -4598,8 +5443,9 @@ class Config:
         if dir:
             fname = os.path.join(dir, fname)
         # Sliently skip missing configuration file.
-        if not os.path.isfile(fname):
+        if not confcache.isfile(fname):
             return False
+        document.depend(fname)
         # Don't load conf files twice (local and application conf files are the
         # same if the source file is in the application directory).
         if os.path.realpath(fname) in self.loaded:
@@ -4648,6 +5494,7 @@ class Config:
         list of lines.
         Updates 'attrs' with parsed [attributes] section entries.
         """
+        Lex.index = None    # The definitions may change.
         # Delete trailing blank lines from sections.
         for k in sections.keys():
             for i in range(len(sections[k])-1,-1,-1):
@@ -4682,10 +5529,13 @@ class Config:
         Title.load(d)
         parse_entries(sections.get('specialcharacters',()),self.specialchars,escape_delimiter=False)
         parse_entries(sections.get('quotes',()),self.quotes)
+        self.quote_reos = None
         self.parse_specialwords()
+        self.specialword_reos = None
         self.parse_replacements()
         self.parse_replacements('replacements2')
         self.parse_replacements('replacements3')
+        self.replacement_reos = {}
         self.parse_specialsections()
         paragraphs.load(sections)
         lists.load(sections)
@@ -4721,7 +5571,7 @@ class Config:
             dirs = self.get_load_dirs()
         for d in dirs:
             f = os.path.join(d,filename)
-            if os.path.isfile(f):
+            if confcache.isfile(f):
                 result.append(f)
         return result
 
@@ -4775,7 +5625,9 @@ class Config:
         for d in dirs:
             # Load filter .conf files.
             filtersdir = os.path.join(d,'filters')
+            confcache.depend(filtersdir)
             for dirpath,dirnames,filenames in os.walk(filtersdir):
+                confcache.depend(dirpath)   # Added and removed filters.
                 subdirs = dirpath[len(filtersdir):].split(os.path.sep)
                 # True if processing a filter specified by a --filter option.
                 filter_opt = len(subdirs) > 1 and subdirs[1] in self.filters
@@ -4872,6 +5724,10 @@ class Config:
                     tag = tag[1:]
                 if not tag in self.tags:
                     message.warning('[quotes] %s missing tag definition: %s' % (q,tag))
+        self.compile_quotes()
+        self.compile_specialwords()
+        for sect in ('replacements','replacements2','replacements3'):
+            self.compile_replacements(sect)
         # Check all specialsections section names exist.
         for k,v in self.specialsections.items():
             if not v:
@@ -4886,6 +5742,38 @@ class Config:
         macros.validate()
         message.linenos = None
 
+    def compile_quotes(self):
+        """
+        Compile the quotes regular expressions, the result is a list of
+        (left quote,tag,regexp) tuples in [quotes] order.
+        """
+        self.quote_reos = []
+        for q in self.quotes.keys():
+            i = q.find('|')
+            if i != -1 and q != '|' and q != '||':
+                lq = q[:i]      # Left quote.
+                rq = q[i+1:]    # Right quote.
+            else:
+                lq = rq = q
+            tag = self.quotes[q]
+            if not tag: continue
+            # Unconstrained quotes prefix the tag name with a hash.
+            if tag[0] == '#':
+                tag = tag[1:]
+                # Unconstrained quotes can appear anywhere.
+                reo = re.compile(r'(?msu)(^|.)(\[(?P<attrlist>[^[\]]+?)\])?' \
+                        + r'(?:' + re.escape(lq) + r')' \
+                        + r'(?P<content>.+?)(?:'+re.escape(rq)+r')')
+            else:
+                # The text within constrained quotes must be bounded by white
+                # space. Non-word (\W) characters are allowed at boundaries to
+                # accomodate enveloping quotes and punctuation e.g. a='x',
+                # ('x'), 'x', ['x'].
+                reo = re.compile(r'(?msu)(^|[^\w;:}])(\[(?P<attrlist>[^[\]]+?)\])?' \
+                    + r'(?:' + re.escape(lq) + r')' \
+                    + r'(?P<content>\S|\S.*?\S)(?:'+re.escape(rq)+r')(?=\W|$)')
+            self.quote_reos.append((lq,tag,reo))
+
     def entries_section(self,section_name):
         """
         Return True if conf file section contains entries, not a markup
@@ -5030,15 +5918,63 @@ class Config:
             replacements[pat] = strip_quotes(rep)
         return True
 
-    def subs_replacements(self,s,sect='replacements'):
-        """Substitute patterns from self.replacements in 's'."""
-        result = s
+    def compile_replacements(self,sect='replacements'):
+        """
+        Compile the replacements in section 'sect' to a (precheck,replacements)
+        tuple. 'replacements' is a list of (regexp,replacement) tuples in
+        section order. 'precheck' is a list of combined regexps, text that
+        matches none of them has nothing to replace; 'precheck' is None if
+        the patterns can't be safely combined.
+        """
+        reps = []
+        combined = OrderedDict()    # Combined patterns keyed by inline flags.
         for pat,rep in getattr(self,sect).items():
-            result = re.sub(pat, rep, result)
-        return result
-
-    def parse_specialwords(self):
-        """Parse special words section into self.specialwords dictionary."""
+            reps.append((re.compile(pat),rep))
+            if combined is None:
+                continue
+            mo = re.match(r'\(\?([iLmsux]+)\)',pat)
+            if mo:
+                flags = ''.join(sorted(set(mo.group(1))))
+                pat = pat[mo.end():]
+            else:
+                flags = ''
+            # Patterns with embedded flags or backreferences can change
+            # meaning when combined.
+            if 'x' in flags or re.search(r'\(\?[iLmsux]|\(\?P=|\\[1-9]',pat):
+                combined = None
+            else:
+                if flags not in combined:
+                    combined[flags] = []
+                combined[flags].append('(?:%s)' % pat)
+        precheck = None
+        if combined is not None:
+            try:
+                precheck = [re.compile(('(?%s)' % flags if flags else '')
+                                + '|'.join(pats))
+                            for flags,pats in combined.items()]
+            except re.error:
+                # e.g. duplicate group names.
+                pass
+        self.replacement_reos[sect] = (precheck,reps)
+
+    def subs_replacements(self,s,sect='replacements'):
+        """Substitute patterns from self.replacements in 's'."""
+        if sect not in self.replacement_reos:
+            self.compile_replacements(sect)
+        precheck,reps = self.replacement_reos[sect]
+        if precheck is not None:
+            for reo in precheck:
+                if reo.search(s):
+                    break
+            else:
+                return s
+        result = s
+        for reo,rep in reps:
+            result = reo.sub(rep, result)
+        return result
+
+    def parse_specialwords(self):
+        """Parse special words section into self.specialwords dictionary."""
         reo = re.compile(r'(?:\s|^)(".+?"|[^"\s]+)(?=\s|$)')
         for line in self.sections.get('specialwords',()):
             e = parse_entry(line)
@@ -5082,12 +6018,37 @@ class Config:
             result = result.replace(v, k)
         return result
 
+    def compile_specialwords(self):
+        """
+        Compile the special words to a (literals,regexps) tuple. 'literals'
+        is a single regexp matching all special words that contain no
+        regular expression syntax (None if there are none) and 'regexps' is
+        a list of the remaining special word regexps.
+        """
+        literals = []
+        regexps = []
+        for word in self.specialwords.keys():
+            if re.search(r'[.^$*+?{}[\]\\|()]',word):
+                regexps.append(re.compile(word))
+            else:
+                literals.append(word)
+        if literals:
+            literals = re.compile(re_words(literals))
+        else:
+            literals = None
+        self.specialword_reos = (literals,regexps)
+
     def subs_specialwords(self,s):
         """Search for word patterns from self.specialwords in 's' and
         substitute using corresponding macro."""
+        if self.specialword_reos is None:
+            self.compile_specialwords()
+        literals,regexps = self.specialword_reos
         result = s
-        for word in self.specialwords.keys():
-            result = re.sub(word, _subs_specialwords, result)
+        if literals is not None:
+            result = literals.sub(_subs_literal_specialwords, result)
+        for reo in regexps:
+            result = reo.sub(_subs_specialwords, result)
         return result
 
     def expand_templates(self,entries):
@@ -5155,6 +6116,558 @@ class Config:
         return (stag,etag)
 
 
+#---------------------------------------------------------------------------
+# Configuration cache.
+#---------------------------------------------------------------------------
+class ConfAttributes(InsensitiveDict):
+    """
+    Document attributes dictionary that records the attributes read and
+    written while configuration files are loaded.
+    """
+    def __init__(self, attrs):
+        InsensitiveDict.__init__(self, attrs)
+        # Attributes the load depends on, values are ('defined',bool) or
+        # ('value',present,value) tuples.
+        self.reads = {}
+        # Attributes set by the load, values are (present,value) tuples.
+        self.writes = OrderedDict()
+        self.complete = True    # False if the whole dictionary was accessed.
+    def record(self, key, defined_only=False):
+        key = key.lower()
+        if key in self.writes:
+            return
+        if key in self.reads:
+            if defined_only or self.reads[key][0] == 'value':
+                return
+        if defined_only:
+            self.reads[key] = ('defined', dict.get(self,key) is not None)
+        else:
+            self.reads[key] = ('value', dict.has_key(self,key),
+                    dict.get(self,key))
+    def isdefined(self, key):
+        self.record(key, defined_only=True)
+        return dict.get(self, key.lower()) is not None
+    def __getitem__(self, key):
+        self.record(key)
+        return InsensitiveDict.__getitem__(self, key)
+    def get(self, key, default=None):
+        self.record(key)
+        return InsensitiveDict.get(self, key, default)
+    def has_key(self, key):
+        self.record(key)
+        return InsensitiveDict.has_key(self, key)
+    def __contains__(self, key):
+        self.record(key)
+        return dict.__contains__(self, key)
+    def setdefault(self, key, default=None):
+        if not self.has_key(key):
+            self[key] = default
+        return self[key]
+    def __setitem__(self, key, value):
+        self.writes[key.lower()] = (True, value)
+        InsensitiveDict.__setitem__(self, key, value)
+    def __delitem__(self, key):
+        self.writes[key.lower()] = (False, None)
+        dict.__delitem__(self, key)
+    def copy(self):
+        self.complete = False
+        return dict.copy(self)
+    def items(self):
+        self.complete = False
+        return dict.items(self)
+    def iteritems(self):
+        self.complete = False
+        return dict.iteritems(self)
+    def keys(self):
+        self.complete = False
+        return dict.keys(self)
+    def values(self):
+        self.complete = False
+        return dict.values(self)
+    def __iter__(self):
+        self.complete = False
+        return dict.__iter__(self)
+
+def file_signature(path):
+    """
+    Return (mode,mtime,size) of file or directory path or None if it does not
+    exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mode, st.st_mtime, st.st_size)
+
+class ConfCache:
+    """
+    Caches the state built by loading configuration files (the Config plus
+    the paragraph, list, block, table and macro definitions) so subsequent
+    documents clone it instead of rereading and reparsing the files.
+
+    A cached state is reused if the files and directories probed while it was
+    loaded are unchanged and the document attributes consulted (e.g. by
+    ifdef::[] macros) have the same values. Loads that evaluate system
+    macros or generate messages are not cached.
+
+    The cache can also be persisted to a file (see open()) so new processes
+    don't have to parse the configuration files.
+    """
+    MAX_STATES = 8          # Maximum number of cached states per key.
+    MAX_KEYS = 100          # Maximum number of keys in the cache file.
+    # Compiled regular expression and match object types.
+    RE_TYPES = (type(re.compile('')), type(re.match('','')))
+    def __init__(self, enabled=False):
+        self.enabled = enabled  # Cache states in memory for later documents.
+        self.states = {}        # Lists of cached states keyed by load key.
+        self.recording = None   # State being loaded.
+        self.token = None       # Token of the cached state config matches.
+        self.fname = None       # Cache file name.
+    def isfile(self, fname):
+        """
+        os.path.isfile() that records fname as a dependency. A missing fname
+        is also recorded as a missing document dependency.
+        """
+        self.depend(fname)
+        if os.path.isfile(fname):
+            return True
+        document.depend(fname)
+        if self.recording is not None:
+            self.recording.missing.append(fname)
+        return False
+    def depend(self, path):
+        """Record file or directory path as a dependency of the load."""
+        if self.recording is not None:
+            self.recording.deps[path] = file_signature(path)
+    def volatile(self):
+        """Flag the current load as uncacheable."""
+        if self.recording is not None:
+            self.recording.cacheable = False
+    def load(self, key, loader):
+        """
+        Restore the configuration state cached for key, if there is no valid
+        state execute the loader function and cache the state it builds.
+        A key of None disables caching, so does a cache that is neither
+        enabled nor persisted (the state would never be reused).
+        """
+        if key is None or not (self.enabled or self.fname):
+            loader()
+            self.token = None
+            return
+        states = self.states.setdefault(key, [])
+        for state in states:
+            if self.isvalid(state):
+                self.restore(state)
+                # The files the configuration was loaded from are document
+                # dependencies.
+                for path in sorted(state.deps):
+                    if os.path.isfile(path):
+                        document.depend(path)
+                for path in state.missing:
+                    document.depend(path)
+                # Most recently used first.
+                states.remove(state)
+                states.insert(0, state)
+                state.used = time.time()
+                return
+        state = self.begin()
+        try:
+            loader()
+        finally:
+            self.end()
+        if state.cacheable:
+            self.save(state)
+            state.used = time.time()
+            states.insert(0, state)
+            del states[self.MAX_STATES:]
+            self.write()
+        else:
+            self.token = None
+    def begin(self):
+        """Start recording a configuration load."""
+        state = AttrDict()
+        state.deps = {}
+        state.missing = []
+        state.cacheable = True
+        state.messages = len(message.messages)
+        self.recording = state
+        document.attributes = ConfAttributes(document.attributes)
+        return state
+    def end(self):
+        """Finish recording the configuration load."""
+        state = self.recording
+        self.recording = None
+        attrs = document.attributes
+        document.attributes = InsensitiveDict(attrs)
+        state.reads = attrs.reads
+        state.writes = attrs.writes
+        if not attrs.complete or len(message.messages) != state.messages:
+            state.cacheable = False
+    def isvalid(self, state):
+        """Return True if state can be used for the current document."""
+        for path,sig in state.deps.items():
+            if file_signature(path) != sig:
+                return False
+        attrs = document.attributes
+        for k,v in state.reads.items():
+            value = dict.get(attrs, k)
+            if v[0] == 'defined':
+                if (value is not None) != v[1]:
+                    return False
+            elif v[1] != dict.has_key(attrs, k) or v[2] != value:
+                return False
+        return True
+    def save(self, state):
+        """Snapshot the loaded configuration."""
+        objects = (config, paragraphs, lists, blocks, tables_OLD, tables,
+                macros)
+        statics = (Title.underlines, Title.subs, Title.pattern,
+                Title.dump_dict, BlockTitle.pattern)
+        state.data, state.regexes = self.dumps((objects, statics))
+        state.index = Lex.index     # Shared by the clones, it isn't modified.
+        state.token = os.urandom(8).encode('hex')
+        self.token = state.token
+    def restore(self, state):
+        """Replace the configuration with a clone of the cached state."""
+        objects, statics = self.loads(state.data, state.regexes)
+        for obj,clone in zip((config, paragraphs, lists, blocks, tables_OLD,
+                tables, macros), objects):
+            obj.__dict__.clear()
+            obj.__dict__.update(clone.__dict__)
+        (Title.underlines, Title.subs, Title.pattern,
+                Title.dump_dict, BlockTitle.pattern) = statics
+        # Cached lookahead refers to the replaced definitions.
+        Lex.prev_element = None
+        Lex.prev_cursor = None
+        Lex.index = state.index
+        for k,(present,value) in state.writes.items():
+            if present:
+                document.attributes[k] = value
+            elif k in document.attributes:
+                del document.attributes[k]
+        self.token = state.token
+    def dumps(self, obj):
+        """
+        Pickle obj. Compiled regular expressions and match objects (which
+        can't be pickled) are returned in a separate list and are shared by
+        the clones.
+        Return (data,regexes) tuple.
+        """
+        regexes = []
+        def persistent_id(obj):
+            if isinstance(obj, self.RE_TYPES):
+                regexes.append(obj)
+                return len(regexes) - 1
+            return None
+        f = cStringIO.StringIO()
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.inst_persistent_id = persistent_id
+        pickler.dump(obj)
+        return (f.getvalue(), regexes)
+    def loads(self, data, regexes):
+        """Unpickle data returned by dumps()."""
+        unpickler = cPickle.Unpickler(cStringIO.StringIO(data))
+        unpickler.persistent_load = regexes.__getitem__
+        unpickler.find_global = self.find_global
+        return unpickler.load()
+    def find_global(self, module, name):
+        """
+        Unpickler class lookup. Classes pickled by asciidoc run as a script
+        belong to __main__ and to the asciidoc module when imported by
+        asciidocapi.py.
+        """
+        if module not in ('__main__', 'asciidoc', __name__):
+            raise cPickle.UnpicklingError('illegal global: %s.%s'
+                    % (module, name))
+        return getattr(sys.modules[__name__], name)
+    def signature(self):
+        """The cache file is invalidated if this changes."""
+        return (VERSION, sys.version, file_signature(APP_FILE))
+    def open(self, fname):
+        """
+        Persist the cache to file fname and load the states it contains.
+        A fname of None disables persistence.
+        """
+        if fname == self.fname:
+            return
+        self.fname = fname
+        if fname is None or not os.path.isfile(fname):
+            return
+        message.verbose('loading: %s' % fname, linenos=False)
+        try:
+            f = open(fname, 'rb')
+            try:
+                unpickler = cPickle.Unpickler(f)
+                unpickler.find_global = self.find_global
+                signature,states = unpickler.load()
+            finally:
+                f.close()
+        except Exception,e:
+            # A damaged cache file is replaced by the next write().
+            message.verbose('ignoring configuration cache: %s: %s'
+                    % (fname, str(e)), linenos=False)
+            return
+        if signature != self.signature():
+            return
+        for key,v in states.items():
+            tokens = [s.token for s in self.states.get(key, ())]
+            for state in v:
+                if state.token not in tokens:
+                    # Recompile the pickled regular expressions.
+                    state.regexes = [r and re.compile(*r)
+                            for r in state.regexes]
+                    self.states.setdefault(key, []).append(state)
+    def write(self):
+        """Write the cache file (if there is one)."""
+        if self.fname is None:
+            return
+        keys = sorted(self.states, reverse=True,
+                key=lambda k: max([s.used for s in self.states[k]] or [0]))
+        states = {}
+        for k in keys[:self.MAX_KEYS]:
+            states[k] = []
+            for state in self.states[k]:
+                state = AttrDict(state)
+                # Store regular expressions as (pattern,flags) tuples, match
+                # objects are dropped.
+                state.regexes = [
+                        isinstance(r, self.RE_TYPES[0]) and (r.pattern, r.flags)
+                        or None for r in state.regexes]
+                states[k].append(state)
+        dirname = os.path.dirname(self.fname)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            # Write to a temporary file then rename it so concurrent
+            # processes never read a partially written cache.
+            fd,tmp = tempfile.mkstemp(dir=dirname)
+            f = os.fdopen(fd, 'wb')
+            try:
+                cPickle.dump((self.signature(), states), f,
+                        cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(self.fname):
+                os.remove(self.fname)
+            os.rename(tmp, self.fname)
+        except (IOError, OSError),e:
+            message.warning('failed to write configuration cache: %s: %s'
+                    % (self.fname, str(e)), linenos=False)
+
+class SectionCache:
+    """
+    Caches the output of document sections so that a document translated
+    again (e.g. reloaded by a viewer after an edit) only translates the
+    sections that have changed.
+
+    A cached section is reused if it starts in the same translation state
+    (section statics, callout map etc.), its source lines (with includes
+    resolved) are unchanged and the document attributes it consulted have
+    the same values. Changes to header attributes or counters alter the
+    attributes and states seen by the following sections so they are
+    translated afresh. Sections that evaluate system macros, process
+    conditional inclusion macros or generate messages are not cached.
+    """
+    MAX_DOCUMENTS = 4       # Maximum number of cached documents.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.documents = []     # MRU list of (key,sections) tuples.
+        self.key = None         # Key of the document being translated.
+        self.sections = None    # Cached sections keyed by starting state.
+        self.translated = None  # Sections of the current translation.
+                                # Both are keyed by statekey().
+        self.recording = None   # Section being translated.
+        self.cursors = None     # Reader lines read by the current section.
+        self.replaying = False  # True while matching cached section lines.
+        self.hits = 0           # Number of reused sections.
+        self.misses = 0         # Number of translated sections.
+    def start(self, key):
+        """
+        Start translating the sections of the document identified by key.
+        A key of None disables caching.
+        """
+        self.hits = 0
+        self.misses = 0
+        if not self.enabled or key is None:
+            self.key = None
+            return
+        self.key = key
+        self.sections = {}
+        for k,sections in self.documents:
+            if k == key:
+                self.sections = sections
+                break
+        self.translated = {}
+    def finish(self):
+        """Cache the sections of the translated document."""
+        if self.key is None:
+            return
+        message.verbose('sections: %d translated, %d reused'
+                % (self.misses, self.hits), linenos=False)
+        self.documents = [(k,v) for k,v in self.documents if k != self.key]
+        self.documents.insert(0, (self.key, self.translated))
+        del self.documents[self.MAX_DOCUMENTS:]
+        self.key = None
+        self.sections = None
+        self.translated = None
+    def volatile(self):
+        """Flag the current section as uncacheable."""
+        if self.recording is not None:
+            self.recording.cacheable = False
+    def translate(self, translator):
+        """
+        Translate the next section by replaying its cached output or by
+        executing the translator function.
+        """
+        if self.key is None:
+            translator()
+            return
+        key = self.statekey()
+        for section in self.sections.get(key, ()):
+            if self.replay(section):
+                self.hits += 1
+                self.save(key, section)
+                return
+        self.misses += 1
+        section = self.begin()
+        try:
+            translator()
+        finally:
+            self.end()
+        if section.cacheable:
+            section.after = self.dumps()
+            self.save(key, section)
+    def begin(self):
+        """Start recording a section translation."""
+        section = AttrDict()
+        section.cacheable = True
+        section.messages = len(message.messages)
+        section.lines_out = writer.lines_out
+        self.recording = section
+        self.cursors = []
+        writer.recorded = []
+        document.attributes = ConfAttributes(document.attributes)
+        return section
+    def end(self):
+        """Finish recording the section translation."""
+        section = self.recording
+        self.recording = None
+        attrs = document.attributes
+        document.attributes = InsensitiveDict(attrs)
+        section.reads = attrs.reads
+        section.writes = attrs.writes
+        section.lines = [cursor[2] for cursor in self.cursors]
+        self.cursors = None
+        section.output = writer.recorded
+        writer.recorded = None
+        section.lines_out = writer.lines_out - section.lines_out
+        if not attrs.complete or len(message.messages) != section.messages:
+            section.cacheable = False
+    def save(self, key, section):
+        """Add section to the sections of the current translation."""
+        if key not in self.translated:
+            self.translated[key] = []
+        self.translated[key].append(section)
+    def isvalid(self, section):
+        """Return True if the attributes read by section are unchanged."""
+        attrs = document.attributes
+        for k,v in section.reads.items():
+            value = dict.get(attrs, k)
+            if v[0] == 'defined':
+                if (value is not None) != v[1]:
+                    return False
+            elif v[1] != dict.has_key(attrs, k) or v[2] != value:
+                return False
+        return True
+    def replay(self, section):
+        """
+        Write the cached section output if the section source lines are next
+        on the input. Return False (leaving the reader and the translation
+        state unchanged) if they are not.
+        """
+        if not self.isvalid(section):
+            return False
+        attrs = InsensitiveDict(document.attributes)
+        state = self.dumps()
+        cursor = reader.cursor
+        self.cursors = []
+        self.replaying = True
+        matched = False
+        try:
+            for line in section.lines:
+                # Compare the source lines read, read() unescapes macros.
+                count = len(self.cursors)
+                if reader.read() is None or len(self.cursors) == count \
+                        or self.cursors[-1][2] != line:
+                    break
+            else:
+                self.replaying = False
+                self.restore(section.after, section.writes)
+                # The section must end where it ended when it was cached.
+                matched = reader.eof() or Lex.next() is Title
+        finally:
+            self.replaying = False
+            cursors = self.cursors
+            self.cursors = None
+        if not matched:
+            for c in reversed(cursors):
+                reader.unread(c)
+            reader.cursor = cursor
+            document.attributes = attrs
+            document.attributes['infile'] = reader.infile
+            document.attributes['indir'] = reader.indir
+            self.restore(state)
+            return False
+        writer.write_recorded(section.output, section.lines_out)
+        return True
+    def state(self):
+        """Return the translation state tuple."""
+        return (document.level, Section.endtags, Section.ids,
+                Title.level, Title.sectname, Title.section_numbers,
+                Title.attributes, Title.linecount, AttributeList.attrs,
+                BlockTitle.title, AbstractBlock.blocknames, calloutmap.__dict__,
+                writer.newline, writer.skip_blank_lines)
+    def dumps(self):
+        """Return the pickled translation state."""
+        return cPickle.dumps(self.state(), cPickle.HIGHEST_PROTOCOL)
+    def statekey(self):
+        """
+        Return a key of the translation state. Unlike the pickled state it
+        only depends on the state values (pickles of equal states differ
+        with object sharing and dictionary order).
+        """
+        def canonical(value):
+            if isinstance(value, dict):
+                return ('{}', tuple(sorted([(k,canonical(v))
+                        for k,v in value.items()])))
+            elif isinstance(value, (list,tuple)):
+                return tuple([canonical(v) for v in value])
+            else:
+                return value
+        return canonical(self.state())
+    def restore(self, state, writes=None):
+        """
+        Restore the translation state returned by dumps() and apply the
+        attribute writes.
+        """
+        (document.level, Section.endtags, Section.ids,
+                Title.level, Title.sectname, Title.section_numbers,
+                Title.attributes, Title.linecount, AttributeList.attrs,
+                BlockTitle.title, AbstractBlock.blocknames, co,
+                writer.newline, writer.skip_blank_lines) = cPickle.loads(state)
+        calloutmap.__dict__.clear()
+        calloutmap.__dict__.update(co)
+        # Cached lookahead may refer to replaced state.
+        Lex.prev_element = None
+        Lex.prev_cursor = None
+        if writes:
+            for k,(present,value) in writes.items():
+                if present:
+                    document.attributes[k] = value
+                elif k in document.attributes:
+                    del document.attributes[k]
+
+
 #---------------------------------------------------------------------------
 # Deprecated old table classes follow.
 # Naming convention is an _OLD name suffix.
@@ -5648,6 +7161,7 @@ class Tables_OLD(AbstractBlocks):
             if not b.footdata:
                 b.footdata = b.bodydata
         self.delimiters = re_join(delimiters)
+        self.build_switch()
         # Check table definitions are valid.
         for b in self.blocks:
             b.validate()
@@ -5867,6 +7381,10 @@ USER_DIR = None             # ~/.asciidoc
 # Global configuration files directory (set by Makefile build target).
 CONF_DIR = '/etc/asciidoc'
 HELP_FILE = 'help.conf'     # Default (English) help file.
+CONF_CACHE_FILE = 'conf.cache'  # --conf-cache file (in ~/.asciidoc).
+DEPS_CACHE_FILE = 'deps.cache'  # --incremental and --batch dependencies.
+# Source files rendered from --batch directories.
+BATCH_PATTERNS = ('*.txt', '*.asciidoc', '*.adoc')
 
 # Globals
 # -------
@@ -5883,11 +7401,102 @@ tables = Tables()           # Table definitions.
 macros = Macros()           # Macro definitions.
 calloutmap = CalloutMap()   # Coordinates callouts and callout list.
 trace = Trace()             # Implements trace attribute processing.
+confcache = ConfCache()     # Loaded configuration cache.
+sectcache = SectionCache()  # Translated section cache (used by Engine).
+attrs_cache = AttrsCache()  # Memoized attribute substitutions.
 
 ### Used by asciidocapi.py ###
 # List of message strings written to stderr.
 messages = message.messages
 
+### Used by asciidocapi.py ###
+class Engine(object):
+    """
+    Reusable translation engine.
+    asciidoc() accumulates state in module globals and class statics, the
+    Engine holds the globals as instance attributes and reset() replaces them
+    with fresh ones. This is a cheap alternative to reloading the asciidoc
+    module between documents for long running API callers.
+    """
+    def __init__(self):
+        # The configuration and section caches are kept across documents.
+        self.confcache = ConfCache(enabled=True)
+        self.sectcache = SectionCache(enabled=True)
+        self.reset()
+    def reset(self):
+        """
+        Reinitialize the globals and class statics and install them in the
+        module namespace.
+        """
+        self.document = Document()
+        self.config = Config()
+        self.reader = Reader()
+        self.writer = Writer()
+        self.message = Message()
+        self.paragraphs = Paragraphs()
+        self.lists = Lists()
+        self.blocks = DelimitedBlocks()
+        self.tables_OLD = Tables_OLD()
+        self.tables = Tables()
+        self.macros = Macros()
+        self.calloutmap = CalloutMap()
+        self.trace = Trace()
+        Lex.prev_element = None
+        Lex.prev_cursor = None
+        Lex.index = None
+        AttributeEntry.pattern = None
+        AttributeEntry.subs = None
+        AttributeEntry.name = None
+        AttributeEntry.name2 = None
+        AttributeEntry.value = None
+        AttributeEntry.attributes = {}
+        AttributeList.pattern = None
+        AttributeList.match = None
+        AttributeList.attrs = {}
+        BlockTitle.title = None
+        BlockTitle.pattern = None
+        Title.underlines = ('==','--','~~','^^','++')
+        Title.subs = ()
+        Title.pattern = None
+        Title.level = 0
+        Title.attributes = {}
+        Title.sectname = None
+        Title.section_numbers = [0]*len(Title.underlines)
+        Title.dump_dict = {}
+        Title.linecount = None
+        Section.endtags = []
+        Section.ids = []
+        AbstractBlock.blocknames = []
+        self.install()
+    def install(self):
+        """Make this engine's globals the module globals."""
+        global document, config, reader, writer, message, messages
+        global paragraphs, lists, blocks, tables_OLD, tables, macros
+        global calloutmap, trace, confcache, sectcache
+        document = self.document
+        config = self.config
+        reader = self.reader
+        writer = self.writer
+        message = self.message
+        messages = self.message.messages
+        paragraphs = self.paragraphs
+        lists = self.lists
+        blocks = self.blocks
+        tables_OLD = self.tables_OLD
+        tables = self.tables
+        macros = self.macros
+        calloutmap = self.calloutmap
+        trace = self.trace
+        confcache = self.confcache
+        sectcache = self.sectcache
+    def execute(self, cmd, opts, args):
+        """
+        Reset the engine then execute() the command-line options and
+        arguments.
+        """
+        self.reset()
+        execute(cmd, opts, args)
+
 
 def asciidoc(backend, doctype, confiles, infile, outfile, options):
     """Convert AsciiDoc document to DocBook document of type doctype
@@ -5900,23 +7509,11 @@ def asciidoc(backend, doctype, confiles, infile, outfile, options):
         files += confiles
         if files:
             for f in files:
-                if os.path.isfile(f):
+                if confcache.isfile(f):
                     config.load_file(f, include=include, exclude=exclude)
                 else:
                     raise EAsciiDoc,'missing configuration file: %s' % f
-    try:
-        document.attributes['python'] = sys.executable
-        for f in config.filters:
-            if not config.find_config_dir('filters', f):
-                raise EAsciiDoc,'missing filter: %s' % f
-        if doctype not in (None,'article','manpage','book'):
-            raise EAsciiDoc,'illegal document type'
-        # Set processing options.
-        for o in options:
-            if o == '-c': config.dumping = True
-            if o == '-s': config.header_footer = False
-            if o == '-v': config.verbose = True
-        document.update_attributes()
+    def load_asciidoc_conf():
         if '-e' not in options:
             # Load asciidoc.conf files in two passes: the first for attributes
             # the second for everything. This is so that locally set attributes
@@ -5925,26 +7522,12 @@ def asciidoc(backend, doctype, confiles, infile, outfile, options):
                 raise EAsciiDoc,'configuration file asciidoc.conf missing'
             load_conffiles(include=['attributes'])
             config.load_from_dirs('asciidoc.conf')
-            if infile != '<stdin>':
-                indir = os.path.dirname(infile)
+            if indir is not None:
                 config.load_file('asciidoc.conf', indir,
                                 include=['attributes','titles','specialchars'])
         else:
             load_conffiles(include=['attributes','titles','specialchars'])
-        document.update_attributes()
-        # Check the infile exists.
-        if infile != '<stdin>':
-            if not os.path.isfile(infile):
-                raise EAsciiDoc,'input file %s missing' % infile
-        document.infile = infile
-        AttributeList.initialize()
-        # Open input file and parse document header.
-        reader.tabsize = config.tabsize
-        reader.open(infile)
-        has_header = document.parse_header(doctype,backend)
-        # doctype is now finalized.
-        document.attributes['doctype-'+document.doctype] = ''
-        config.set_theme_attributes()
+    def load_backend_conf():
         # Load backend configuration files.
         if '-e' not in options:
             f = document.backend + '.conf'
@@ -5955,24 +7538,78 @@ def asciidoc(backend, doctype, confiles, infile, outfile, options):
         # backend is now known.
         document.attributes['backend-'+document.backend] = ''
         document.attributes[document.backend+'-'+document.doctype] = ''
-        doc_conffiles = []
         if '-e' not in options:
             # Load filters and language file.
             config.load_filters()
             document.load_lang()
-            if infile != '<stdin>':
+            if indir is not None:
                 # Load local conf files (files in the source file directory).
                 config.load_file('asciidoc.conf', indir)
                 config.load_backend([indir])
                 config.load_filters([indir])
                 # Load document specific configuration files.
-                f = os.path.splitext(infile)[0]
-                doc_conffiles = [
-                        f for f in (f+'.conf', f+'-'+document.backend+'.conf')
-                        if os.path.isfile(f) ]
                 for f in doc_conffiles:
                     config.load_file(f)
         load_conffiles()
+        # Configuration is fully loaded.
+        config.expand_all_templates()
+        # Check configuration for consistency.
+        config.validate()
+        Lex.build_index()
+    def cache_key(*args):
+        # Everything other than document attributes the configuration
+        # depends on.
+        return args + (VERSION, tuple(config.get_load_dirs()),
+                tuple(options), tuple(confiles), indir, document.safe,
+                tuple(sorted(config.cmd_attrs.items())), tuple(config.filters))
+    try:
+        document.attributes['python'] = sys.executable
+        for f in config.filters:
+            if not config.find_config_dir('filters', f):
+                raise EAsciiDoc,'missing filter: %s' % f
+        if doctype not in (None,'article','manpage','book'):
+            raise EAsciiDoc,'illegal document type'
+        # Set processing options.
+        for o in options:
+            if o == '-c': config.dumping = True
+            if o == '-s': config.header_footer = False
+            if o == '-v': config.verbose = True
+        document.update_attributes()
+        if infile != '<stdin>':
+            indir = os.path.dirname(infile)
+        else:
+            indir = None
+        confcache.load(cache_key('asciidoc'), load_asciidoc_conf)
+        document.update_attributes()
+        # Check the infile exists.
+        if infile != '<stdin>':
+            if not os.path.isfile(infile):
+                raise EAsciiDoc,'input file %s missing' % infile
+        document.infile = infile
+        if infile != '<stdin>':
+            document.depend(infile)
+        AttributeList.initialize()
+        # Open input file and parse document header.
+        reader.tabsize = config.tabsize
+        reader.open(infile)
+        has_header = document.parse_header(doctype,backend)
+        # doctype is now finalized.
+        document.attributes['doctype-'+document.doctype] = ''
+        config.set_theme_attributes()
+        doc_conffiles = []
+        if '-e' not in options and indir is not None:
+            # Document specific configuration files.
+            name = os.path.splitext(infile)[0]
+            for f in (name+'.conf', name+'-'+document.backend+'.conf'):
+                if os.path.isfile(f):
+                    doc_conffiles.append(f)
+                else:
+                    document.depend(f)
+        if confcache.token is not None:
+            key = cache_key('backend', confcache.token, tuple(doc_conffiles))
+        else:
+            key = None  # Configuration not built from a cached state.
+        confcache.load(key, load_backend_conf)
         # Build asciidoc-args attribute.
         args = ''
         # Add custom conf file arguments.
@@ -6004,17 +7641,18 @@ def asciidoc(backend, doctype, confiles, infile, outfile, options):
         if 'data-uri' in  document.attributes and not os.path.isdir(document.attributes['iconsdir']):
             document.attributes['iconsdir'] = os.path.join(
                      document.attributes['asciidoc-confdir'], 'images/icons')
-        # Configuration is fully loaded.
-        config.expand_all_templates()
-        # Check configuration for consistency.
-        config.validate()
         # Initialize top level block name.
         if document.attributes.get('blockname'):
             AbstractBlock.blocknames.append(document.attributes['blockname'])
         paragraphs.initialize()
         lists.initialize()
         if config.dumping:
-            config.dump()
+            stdout = sys.stdout
+            sys.stdout = writer.stdout or sys.stdout
+            try:
+                config.dump()
+            finally:
+                sys.stdout = stdout
         else:
             writer.newline = config.newline
             try:
@@ -6124,6 +7762,9 @@ def execute(cmd,opts,args):
     outfile = None
     options = []
     help_option = False
+    conf_cache = False
+    incremental = False
+    depfile = False
     for o,v in opts:
         if o in ('--help','-h'):
             help_option = True
@@ -6139,6 +7780,12 @@ def execute(cmd,opts,args):
             backend = v
         if o in ('-c','--dump-conf'):
             options.append('-c')
+        if o == '--conf-cache':
+            conf_cache = True
+        if o == '--deps':
+            depfile = True
+        if o == '--incremental':
+            incremental = True
         if o in ('-d','--doctype'):
             doctype = v
         if o in ('-e','--no-conf'):
@@ -6182,7 +7829,10 @@ def execute(cmd,opts,args):
     if len(args) == 0:
         usage('No source file specified')
         sys.exit(1)
-    stdin,stdout = sys.stdin,sys.stdout
+    if conf_cache and userdir():
+        confcache.open(os.path.join(userdir(), '.asciidoc', CONF_CACHE_FILE))
+    else:
+        confcache.open(None)
     try:
         infile = args[0]
         if infile == '-':
@@ -6190,7 +7840,7 @@ def execute(cmd,opts,args):
         elif isinstance(infile, str):
             infile = os.path.abspath(infile)
         else:   # Input file is file object from API call.
-            sys.stdin = infile
+            reader.stdin = infile
             infile = '<stdin>'
         if outfile == '-':
             outfile = '<stdout>'
@@ -6200,14 +7850,302 @@ def execute(cmd,opts,args):
             if infile == '<stdin>':
                 outfile = '<stdout>'
         else:   # Output file is file object from API call.
-            sys.stdout = outfile
+            writer.stdout = outfile
             outfile = '<stdout>'
+        cache = None
+        if incremental and userdir() and '<stdin>' not in (infile,outfile):
+            cache = DepsCache()
+            cache.open(os.path.join(userdir(), '.asciidoc', DEPS_CACHE_FILE))
+            key = deps_key(infile, opts)
+            if cache.isuptodate(key):
+                if '-v' in options:
+                    message.stderr('up to date: %s' % cache.entries[key][0])
+                return
         # Do the work.
         asciidoc(backend, doctype, confiles, infile, outfile, options)
         if document.has_errors:
+            if cache is not None:
+                cache.update(key, None, [])
+                cache.write()
             sys.exit(1)
+        if document.outfile == '<stdout>' or config.dumping:
+            return
+        if depfile:
+            document.write_depfile(document.outfile + '.d')
+        if cache is not None:
+            cache.update(key, document.outfile,
+                    document.dependencies + document.missing)
+            cache.write()
     finally:
-        sys.stdin,sys.stdout = stdin,stdout
+        reader.stdin = None
+        writer.stdout = None
+
+#---------------------------------------------------------------------------
+# Incremental and batch rendering.
+#---------------------------------------------------------------------------
+def deps_key(infile, opts):
+    """
+    Return the dependency cache key of source file infile rendered with
+    command-line options opts.
+    """
+    opts = [(o,v) for o,v in opts
+            if o not in ('--batch','--force','--incremental','--jobs')]
+    return (infile, tuple(opts))
+
+class DepsCache:
+    """
+    A database of the output file and the files (dependencies) each
+    document was generated from, used to skip documents that are up to
+    date.
+    """
+    def __init__(self):
+        self.entries = {}   # (outfile,signature,deps) keyed by deps_key().
+        self.updates = {}   # Entries changed since open().
+        self.fname = None   # Cache file name.
+    def signature(self):
+        """The cache file is invalidated if this changes."""
+        return (VERSION, file_signature(APP_FILE))
+    def open(self, fname):
+        """Load the entries from file fname (None disables the cache)."""
+        self.fname = fname
+        self.entries = self.load()
+        self.updates = {}
+    def load(self):
+        """Return the entries in the cache file."""
+        fname = self.fname
+        if fname is None or not os.path.isfile(fname):
+            return {}
+        try:
+            f = open(fname, 'rb')
+            try:
+                signature,entries = cPickle.load(f)
+            finally:
+                f.close()
+        except Exception,e:
+            message.verbose('ignoring dependency cache: %s: %s'
+                    % (fname, str(e)), linenos=False)
+            return {}
+        if signature != self.signature():
+            return {}
+        return entries
+    def isuptodate(self, key):
+        """Return True if the document's output and dependencies are unchanged."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        outfile,sig,deps = entry
+        if file_signature(outfile) != sig:
+            return False
+        for path,sig in deps.items():
+            if file_signature(path) != sig:
+                return False
+        return True
+    def update(self, key, outfile, deps):
+        """
+        Record the output file and dependencies of a rendered document, an
+        outfile of None drops the entry. Missing dependencies are recorded
+        with a None signature so creating them invalidates the entry.
+        """
+        if outfile is None:
+            entry = None
+        else:
+            entry = (outfile, file_signature(outfile),
+                    dict([(f, file_signature(f)) for f in deps]))
+        self.updates[key] = entry
+        if entry is None:
+            self.entries.pop(key, None)
+        else:
+            self.entries[key] = entry
+    def write(self):
+        """Write the cache file (if there is one)."""
+        if self.fname is None:
+            return
+        # Merge the updates with the current file contents in case another
+        # asciidoc process has written it since open().
+        entries = self.load()
+        for key,entry in self.updates.items():
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+        dirname = os.path.dirname(self.fname)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd,tmp = tempfile.mkstemp(dir=dirname)
+            f = os.fdopen(fd, 'wb')
+            try:
+                cPickle.dump((self.signature(), entries), f,
+                        cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(self.fname):
+                os.remove(self.fname)
+            os.rename(tmp, self.fname)
+        except (IOError, OSError),e:
+            message.stderr('failed to write dependency cache: %s: %s'
+                    % (self.fname, str(e)))
+
+def batch_files(args):
+    """
+    Return the source files named by args. Directories are searched
+    recursively for files matching BATCH_PATTERNS, other arguments are glob
+    patterns.
+    """
+    result = []
+    for arg in args:
+        if os.path.isdir(arg):
+            files = []
+            for dirpath,dirnames,filenames in os.walk(arg):
+                # Skip hidden directories.
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for pattern in BATCH_PATTERNS:
+                    files += [os.path.join(dirpath, f)
+                            for f in fnmatch.filter(filenames, pattern)]
+        else:
+            files = [f for f in glob.glob(arg) if os.path.isfile(f)]
+        if not files:
+            message.stderr('WARNING: no source files: %s' % arg)
+        for f in files:
+            f = os.path.abspath(f)
+            if f not in result:
+                result.append(f)
+    result.sort()
+    return result
+
+batch_engine = None     # The batch worker's engine.
+
+def batch_init(pooled=False):
+    """Create the batch worker's engine."""
+    global batch_engine
+    if pooled:
+        # The parent process handles keyboard interrupts.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    batch_engine = Engine()
+    # Documents are rendered once per run so recording sections is wasted.
+    batch_engine.sectcache.enabled = False
+
+def batch_render(task):
+    """
+    Render a batch task (cmd,opts,infile), the engine (and the
+    configuration cache it holds) is reused from the previous task.
+    Returns (infile,outfile,deps,elapsed,errors) where outfile is None if
+    the document failed and errors is the message output.
+    """
+    cmd,opts,infile = task
+    started = time.time()
+    stderr = sys.stderr
+    sys.stderr = cStringIO.StringIO()
+    try:
+        try:
+            batch_engine.execute(cmd, opts, [infile])
+            failed = False
+        except SystemExit,e:
+            failed = e.code not in (None, 0)
+        except Exception,e:
+            print >>sys.stderr, '%s: FAILED: %s: unexpected error: %s' \
+                    % (Message.PROG, infile, str(e))
+            failed = True
+        errors = sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+    document = batch_engine.document
+    if failed or not document.outfile:
+        outfile,deps = None,[]
+    else:
+        outfile = document.outfile
+        deps = document.dependencies + document.missing
+    return (infile, outfile, deps, time.time() - started, errors)
+
+def batch(cmd, opts, args):
+    """
+    Render all the source files named by args (directories and glob
+    patterns) with the asciidoc options opts. The documents are rendered
+    by worker processes that keep their engine between documents, documents
+    whose output is newer than the files it was generated from are skipped.
+    """
+    config.init(cmd)
+    jobs = None
+    force = False
+    options = []
+    for o,v in opts:
+        if o in ('--batch','--incremental'):
+            continue
+        elif o == '--force':
+            force = True
+        elif o == '--jobs':
+            try:
+                jobs = int(v)
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                die('illegal --jobs option: %s' % v)
+        elif o in ('-o','--out-file','-c','--dump-conf'):
+            die('%s option not allowed in batch mode' % o)
+        else:
+            options.append((o,v))
+    if not args:
+        usage('No source directory or files specified')
+        sys.exit(1)
+    started = time.time()
+    infiles = batch_files(args)
+    cache = DepsCache()
+    if userdir():
+        cache.open(os.path.join(userdir(), '.asciidoc', DEPS_CACHE_FILE))
+    tasks = []
+    skipped = 0
+    for infile in infiles:
+        if not force and cache.isuptodate(deps_key(infile, options)):
+            skipped += 1
+        else:
+            tasks.append((cmd, options, infile))
+    # Start the biggest documents first so the workers finish together.
+    tasks.sort(key=lambda t: -os.path.getsize(t[2]))
+    if multiprocessing is None:
+        jobs = 1
+    elif jobs is None:
+        try:
+            jobs = multiprocessing.cpu_count()
+        except NotImplementedError:
+            jobs = 1
+    jobs = min(jobs, len(tasks))
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, batch_init, (True,))
+        results = pool.imap_unordered(batch_render, tasks)
+    else:
+        batch_init()
+        results = (batch_render(task) for task in tasks)
+    failures = []
+    try:
+        try:
+            for infile,outfile,deps,elapsed,errors in results:
+                sys.stderr.write(errors)
+                if outfile is None:
+                    failures.append(infile)
+                    print '%7.2fs FAILED %s' % (elapsed, infile)
+                else:
+                    print '%7.2fs %s' % (elapsed, infile)
+                sys.stdout.flush()
+                cache.update(deps_key(infile, options), outfile, deps)
+            if pool is not None:
+                pool.close()
+        except KeyboardInterrupt:
+            if pool is not None:
+                pool.terminate()
+            raise
+    finally:
+        if pool is not None:
+            pool.join()
+        cache.write()
+    print '%d rendered, %d up to date, %d failed in %.2fs (%d jobs)' % \
+            (len(tasks) - len(failures), skipped, len(failures),
+             time.time() - started, max(jobs,1))
+    if failures:
+        message.stderr('FAILED: %d documents:' % len(failures))
+        for f in failures:
+            message.stderr('  %s' % f)
+        sys.exit(1)
 
 if __name__ == '__main__':
     # Process command line options.
@@ -6216,10 +8154,10 @@ if __name__ == '__main__':
         #DEPRECATED: --unsafe option.
         opts,args = getopt.getopt(sys.argv[1:],
             'a:b:cd:ef:hno:svw:',
-            ['attribute=','backend=','conf-file=','doctype=','dump-conf',
+            ['attribute=','backend=','conf-cache','conf-file=','doctype=','dump-conf',
             'help','no-conf','no-header-footer','out-file=',
             'section-numbers','verbose','version','safe','unsafe',
-            'doctest','filter=','theme='])
+            'doctest','filter=','theme=','batch','jobs=','force','deps','incremental'])
     except getopt.GetoptError:
         message.stderr('illegal command options')
         sys.exit(1)
@@ -6257,6 +8195,12 @@ if __name__ == '__main__':
         config.init(sys.argv[0])
         config.verbose = bool(set(['-v','--verbose']) & set(opt_names))
         getattr(Plugin,cmd)(args)
+    elif '--batch' in opt_names:
+        # Render directory trees.
+        try:
+            batch(sys.argv[0],opts,args)
+        except KeyboardInterrupt:
+            sys.exit(1)
     else:
         # Execute asciidoc.
         try:
@@ -33,7 +33,58 @@ Doctests:
    >>> print outfile.getvalue()
    <simpara>Hello <emphasis>Bill Smith</emphasis></simpara>
 
-2. Check error handling:
+2. Check document attributes are not carried over between documents:
+
+   >>> asciidoc = AsciiDocAPI()
+   >>> asciidoc.options('--no-header-footer')
+   >>> infile = StringIO.StringIO(':author: Joe Bloggs\\n\\nBy {author=nobody}')
+   >>> outfile = StringIO.StringIO()
+   >>> asciidoc.execute(infile, outfile, backend='html4')
+   >>> print outfile.getvalue()
+   <p>By Joe Bloggs</p>
+
+   >>> infile = StringIO.StringIO('By {author=nobody}')
+   >>> outfile = StringIO.StringIO()
+   >>> asciidoc.execute(infile, outfile, backend='html4')
+   >>> print outfile.getvalue()
+   <p>By nobody</p>
+
+3. Check streamed output:
+
+   >>> asciidoc = AsciiDocAPI()
+   >>> asciidoc.options('--no-header-footer')
+   >>> infile = StringIO.StringIO('Hello *world*')
+   >>> print ''.join(asciidoc.stream(infile, backend='html4'))
+   <p>Hello <strong>world</strong></p>
+
+4. Check cached output:
+
+   >>> asciidoc = AsciiDocAPI()
+   >>> asciidoc.options('--no-header-footer')
+   >>> asciidoc.cache = OutputCache()
+   >>> for i in range(2):
+   ...     outfile = StringIO.StringIO()
+   ...     asciidoc.execute(StringIO.StringIO('Hello *world*'), outfile)
+   ...     print outfile.getvalue()
+   <div class="paragraph"><p>Hello <strong>world</strong></p></div>
+   <BLANKLINE>
+   <div class="paragraph"><p>Hello <strong>world</strong></p></div>
+   <BLANKLINE>
+   >>> asciidoc.cache.hits, asciidoc.cache.misses
+   (1, 1)
+
+5. Check unchanged sections are reused when a document is translated again:
+
+   >>> asciidoc = AsciiDocAPI()
+   >>> source = 'Title\\n=====\\n\\n== One\\n\\n\\\\ifdef::x[]\\n\\n== Two\\n\\nText.\\n'
+   >>> for i in range(2):
+   ...     asciidoc.execute(StringIO.StringIO(source), StringIO.StringIO())
+   ...     sections = asciidoc.engine.sectcache
+   ...     print sections.hits, sections.misses
+   0 2
+   2 0
+
+6. Check error handling:
 
    >>> import StringIO
    >>> asciidoc = AsciiDocAPI()
@@ -52,7 +103,8 @@ under the terms of the GNU General Public License (GPL).
 
 """
 
-import sys,os,re,imp
+import sys,os,re,imp,threading,Queue
+import cPickle,hashlib,tempfile,StringIO
 
 API_VERSION = '0.1.2'
 MIN_ASCIIDOC_VERSION = '8.4.1'  # Minimum acceptable AsciiDoc version.
@@ -91,6 +143,152 @@ class Options(object):
         self.values.append((name,value))
 
 
+def file_signature(path):
+    """
+    Return (mode,mtime,size) of file path or None if it does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mode, st.st_mtime, st.st_size)
+
+
+class Recorder(object):
+    """
+    File-like object that records the output written to file object f.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.chunks = []
+    def write(self, s):
+        self.f.write(s)
+        self.chunks.append(s)
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class OutputCache(object):
+    """
+    Least recently used cache of AsciiDocAPI output. The cached output of
+    a document is used until its source, attributes, options or any of the
+    files it was generated from change. The memory used is bounded by
+    maxbytes, if directory is set entries are also written to files in
+    directory bounded by diskbytes.
+    """
+    def __init__(self, maxbytes=32*1024*1024, directory=None,
+            diskbytes=256*1024*1024):
+        self.maxbytes = maxbytes
+        self.directory = directory
+        self.diskbytes = diskbytes
+        self.entries = {}   # Cached entries keyed by key digest.
+        self.keys = []      # Entry keys, most recently used first.
+        self.size = 0       # Total output size of entries.
+        self.hits = 0
+        self.misses = 0
+    def get(self, key):
+        """Return the valid entry cached for key or None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.read(key)
+            if entry is not None:
+                self.insert(key, entry)
+        if entry is not None:
+            for path,sig in entry['deps'].items():
+                if file_signature(path) != sig:
+                    self.remove(key)
+                    entry = None
+                    break
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.keys.remove(key)
+            self.keys.insert(0, key)
+        return entry
+    def put(self, key, output, messages, dependencies, outfile=None,
+            missing=()):
+        """
+        Cache the output of a document. The missing files the document
+        probed for invalidate the entry if they are created.
+        """
+        self.remove(key)
+        deps = dict([(f, file_signature(f)) for f in dependencies])
+        for f in missing:
+            deps[f] = None
+        entry = {'output': output, 'messages': messages,
+                'dependencies': dependencies, 'outfile': outfile,
+                'deps': deps}
+        self.insert(key, entry)
+        self.write(key, entry)
+    def insert(self, key, entry):
+        """Add entry, dropping the least recently used entries over maxbytes."""
+        self.entries[key] = entry
+        self.keys.insert(0, key)
+        self.size += len(entry['output'])
+        while self.size > self.maxbytes and len(self.keys) > 1:
+            self.remove(self.keys[-1], disk=False)
+    def remove(self, key, disk=True):
+        """Drop the entry cached for key."""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.keys.remove(key)
+            self.size -= len(entry['output'])
+        if disk and self.directory:
+            try:
+                os.remove(self.filename(key))
+            except OSError:
+                pass
+    def filename(self, key):
+        return os.path.join(self.directory, key + '.cache')
+    def read(self, key):
+        """Return the entry cached on disk for key or None."""
+        if not self.directory:
+            return None
+        fname = self.filename(key)
+        try:
+            f = open(fname, 'rb')
+            try:
+                entry = cPickle.load(f)
+            finally:
+                f.close()
+            os.utime(fname, None)   # Most recently used.
+        except Exception:
+            return None
+        return entry
+    def write(self, key, entry):
+        """Write the entry to disk then prune the least recently used
+        entries."""
+        if not self.directory:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd,tmp = tempfile.mkstemp(dir=self.directory)
+            f = os.fdopen(fd, 'wb')
+            try:
+                cPickle.dump(entry, f, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            fname = self.filename(key)
+            if os.name == 'nt' and os.path.exists(fname):
+                os.remove(fname)
+            os.rename(tmp, fname)
+            files = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.cache'):
+                    st = os.stat(os.path.join(self.directory, name))
+                    files.append((st.st_mtime, st.st_size, name))
+            files.sort(reverse=True)
+            size = 0
+            for mtime,fsize,name in files:
+                size += fsize
+                if size > self.diskbytes:
+                    os.remove(os.path.join(self.directory, name))
+        except (IOError, OSError):
+            pass
+
+
 class Version(object):
     """
     Parse and compare AsciiDoc version numbers. Instance attributes:
@@ -153,6 +351,8 @@ class AsciiDocAPI(object):
         self.options = Options()
         self.attributes = {}
         self.messages = []
+        self.dependencies = []
+        self.cache = None
         # Search for the asciidoc command file.
         # Try ASCIIDOC_PY environment variable first.
         cmd = os.environ.get('ASCIIDOC_PY')
@@ -177,6 +377,10 @@ class AsciiDocAPI(object):
                     raise AsciiDocError('failed to locate asciidoc')
         self.cmd = os.path.realpath(cmd)
         self.__import_asciidoc()
+        # Reusable translation engine (None if asciidoc predates it).
+        self.engine = None
+        if hasattr(self.asciidoc, 'Engine'):
+            self.engine = self.asciidoc.Engine()
 
     def __import_asciidoc(self, reload=False):
         '''
@@ -219,20 +423,16 @@ class AsciiDocAPI(object):
         Compile infile to outfile using backend format.
         infile can outfile can be file path strings or file like objects.
         """
-
-        # NOTE: (JRR@201411062020) This is a hack to prevent document header
-        # attributes from being carried over after a file has been rendered.
-        self.asciidoc.AttributeEntry.attributes = {}
-        self.asciidoc.document.attributes['date'] = None
-        self.asciidoc.document.attributes['revdate'] = None
-        self.asciidoc.document.attributes['author'] = ""
-        self.asciidoc.document.attributes['firstname'] = ""
-        self.asciidoc.document.attributes['lastname'] = ""
-        self.asciidoc.document.attributes['title'] = ""
-        self.asciidoc.document.attributes['doctitle'] = ""
-        self.asciidoc.document.attributes['asciidoc-args'] = ""
-
         self.messages = []
+        self.dependencies = []
+        key = None
+        if self.cache is not None and self.engine and '-' not in (infile,outfile):
+            infile,key = self.__cache_key(infile, outfile, backend)
+            if key is not None:
+                if self.__cache_get(key, outfile):
+                    return
+                if hasattr(outfile, 'write'):
+                    outfile = Recorder(outfile)
         opts = Options(self.options.values)
         if outfile is not None:
             opts('--out-file', outfile)
@@ -249,16 +449,128 @@ class AsciiDocAPI(object):
         args = [infile]
         # The AsciiDoc command was designed to process source text then
         # exit, there are globals and statics in asciidoc.py that have
-        # to be reinitialized before each run -- hence the reload.
-        self.__import_asciidoc(reload=True)
+        # to be reinitialized before each run -- the engine resets them,
+        # older asciidoc versions have to be reloaded.
         try:
             try:
-                self.asciidoc.execute(self.cmd, opts.values, args)
+                if self.engine:
+                    self.engine.execute(self.cmd, opts.values, args)
+                else:
+                    self.__import_asciidoc(reload=True)
+                    self.asciidoc.execute(self.cmd, opts.values, args)
             finally:
                 self.messages = self.asciidoc.messages[:]
+                # Older asciidoc versions don't record dependencies.
+                self.dependencies = getattr(self.asciidoc.document,
+                        'dependencies', [])[:]
         except SystemExit, e:
             if e.code:
                 raise AsciiDocError(self.messages[-1])
+        if key is not None:
+            self.__cache_put(key, outfile)
+
+    def __cache_key(self, infile, outfile, backend):
+        """
+        Return the (possibly replaced) infile and the cache key of the
+        execution, the key is None if the source can't be read.
+        """
+        try:
+            if hasattr(infile, 'read'):
+                # Read the source so it can be hashed.
+                source = infile.read()
+                infile = StringIO.StringIO(source)
+                path = None
+            else:
+                path = os.path.abspath(infile)
+                f = open(path, 'rb')
+                try:
+                    source = f.read()
+                finally:
+                    f.close()
+        except (IOError, OSError):
+            return (infile, None)
+        if hasattr(outfile, 'write'):
+            outfile = None
+        elif outfile is not None:
+            outfile = os.path.abspath(outfile)
+        sha = hashlib.sha1(source)
+        sha.update(repr((path, outfile, backend, self.options.values,
+                sorted(self.attributes.items()), self.asciidoc.VERSION,
+                file_signature(self.cmd))))
+        return (infile, sha.hexdigest())
+
+    def __cache_get(self, key, outfile):
+        """
+        Write the output cached for key to outfile. Return False if there is
+        no cached output.
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            return False
+        self.messages = entry['messages'][:]
+        self.dependencies = entry['dependencies'][:]
+        if hasattr(outfile, 'write'):
+            outfile.write(entry['output'])
+        else:
+            f = open(entry['outfile'], 'wb')
+            try:
+                f.write(entry['output'])
+            finally:
+                f.close()
+        return True
+
+    def __cache_put(self, key, outfile):
+        """Cache the output of the last execution."""
+        document = self.asciidoc.document
+        if document.volatile:
+            return
+        if isinstance(outfile, Recorder):
+            output = outfile.getvalue()
+            outfile = None
+        else:
+            outfile = document.outfile
+            f = open(outfile, 'rb')
+            try:
+                output = f.read()
+            finally:
+                f.close()
+        self.cache.put(key, output, self.messages[:], self.dependencies[:],
+                outfile, document.missing[:])
+
+    def stream(self, infile, backend=None):
+        """
+        Generator that compiles infile using backend format and yields the
+        output in chunks as it is written.
+        infile can be a file path string or a file like object.
+        The compilation runs in a separate thread, don't use this instance
+        for another compilation until the generator is exhausted.
+        """
+        chunks = Queue.Queue()
+        class Output(object):
+            def write(self, s):
+                chunks.put(s)
+            def flush(self):
+                pass
+        errors = []
+        def translate():
+            try:
+                try:
+                    self.execute(infile, Output(), backend)
+                except Exception:
+                    errors.append(sys.exc_info())
+            finally:
+                chunks.put(None)
+        thread = threading.Thread(target=translate)
+        thread.setDaemon(True)
+        thread.start()
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
 
 if __name__ == "__main__":
     """
@@ -8,8 +8,12 @@
 ## SECTION: Imports                                             #
 ##==============================================================#
 
+import csv
 import fnmatch
+import hashlib
+import json
 import os
+import re
 import shutil
 import sys
 import tempfile
@@ -19,12 +23,13 @@ import webbrowser
 import zipfile
 import os.path as op
 from ctypes import *
+from StringIO import StringIO
 
 import PySide
 from PySide.QtCore import *
 from PySide.QtGui import *
 from PySide.QtWebKit import *
-from asciidocapi import AsciiDocAPI
+from asciidocapi import AsciiDocAPI, OutputCache
 
 import doctview
 
@@ -49,7 +54,8 @@ if getattr(sys, 'frozen', None):
     RENDER = op.join(sys._MEIPASS, r"static\render.html")
 RENDER = QUrl().fromLocalFile(op.abspath(RENDER))
 
-# Prefix of the generated HTML document.
+# Prefix of the generated HTML document (only written to disk when the
+# document is displayed in an external browser).
 DOCPRE = "__doctrine-"
 # Extension of the generated HTML document.
 DOCEXT = ".html"
@@ -57,23 +63,265 @@ DOCEXT = ".html"
 # URL prefix of a local file.
 URLFILE = "file:///"
 
+# Milliseconds to wait after a watched file changes before the document is
+# reloaded, so a burst of saves is rendered once.
+AUTORELOAD_DELAY = 300
+
+# Bytes of rendered HTML kept in memory so that documents opened again are
+# displayed without rendering them.
+RENDER_CACHE_SIZE = 32 * 1024 * 1024
+
 # Name of archive info file.
 ARCINFO = "__archive_info__.txt"
 
+# Start tags and CSS selectors of the blocks that can be patched into a
+# displayed document instead of reloading it.
+PATCHABLE = [
+    ('<div class="sect1">', "div.sect1"),
+    ('<div id="footer">', "div#footer")]
+
+# Script that replaces the Nth block matching a selector.
+PATCHJS = 'document.querySelectorAll("%s")[%d].outerHTML = %s;'
+
+# Rows of a CSV file rendered at a time, the following rows are rendered when
+# the view is scrolled to the end of the table.
+CSV_PAGE_ROWS = 500
+
+# Script appended to rendered CSV files, requests the following rows from the
+# application when the view is scrolled near the end of the table.
+CSVJS = """\
+<script type="text/javascript">
+var doctrineDone = false, doctrinePending = false;
+function doctrineMore() {
+  var end = document.body.scrollHeight - 2 * window.innerHeight;
+  if (doctrineDone || doctrinePending || !window.doctrine ||
+      window.pageYOffset < end) {
+    return;
+  }
+  doctrinePending = true;
+  doctrine.more();
+}
+function doctrineRows(rows) {
+  doctrinePending = false;
+  if (rows === null) {
+    doctrineDone = true;
+    return;
+  }
+  var tbody = document.getElementsByTagName("tbody");
+  tbody[tbody.length - 1].insertAdjacentHTML("beforeend", rows);
+  doctrineMore();
+}
+window.addEventListener("scroll", doctrineMore, false);
+window.addEventListener("load", doctrineMore, false);
+</script>"""
+
+# Script that appends rendered rows (null once all rows have been rendered) to
+# the table of a displayed CSV file.
+ROWSJS = 'if (window.doctrineRows) doctrineRows(%s);'
+
+# Matches the tags that open or close an HTML div.
+DIVTAG = re.compile(r'<div\b|</div>')
+
+# Matches the section headings the table of contents is generated from.
+HEADING = re.compile(r'<h[1-6]\b.*?</h[1-6]>', re.S)
+
 # Name and version of the application.
 NAMEVER = "Doctrine 0.1.0-alpha"
 
 FILETYPES = dict()
 FILETYPES['AsciiDoc'] = ["*.txt", "*.ad", "*.adoc", "*.asciidoc"]
 FILETYPES['Zip File'] = ["*.zip"]
+FILETYPES['CSV File'] = ["*.csv"]
 
 ##==============================================================#
 ## SECTION: Class Definitions                                   #
 ##==============================================================#
 
+class RenderCancelled(Exception):
+    """Raised to abandon a render that has been superseded."""
+
+class RenderOutput(StringIO):
+    """Output of a render, abandons the render by raising RenderCancelled
+    once the given stale function returns true."""
+
+    def __init__(self, stale):
+        StringIO.__init__(self)
+        self.stale = stale
+
+    def write(self, s):
+        if self.stale():
+            raise RenderCancelled()
+        StringIO.write(self, s)
+
+class PageBridge(QObject):
+    """Exposes the application to the scripts of displayed documents."""
+
+    #: Emitted when the displayed document requests its following rows.
+    more_requested = Signal()
+
+    @Slot()
+    def more(self):
+        """Requests the following rows of the displayed CSV file."""
+        self.more_requested.emit()
+
+class Renderer(QObject):
+    """Renders AsciiDoc documents on the thread it has been moved to. Only the
+    most recent load request is rendered, superseded requests are skipped or
+    abandoned."""
+
+    #: Emitted when a load request has been handled with the request number,
+    #: the rendered HTML and its base directory (None if there is nothing to
+    #: display), the error message (None if there was no error), the files
+    #: the document was rendered from and their digest.
+    rendered = Signal(object, object, object, object, object)
+
+    #: Emitted when a request for the following rows of a CSV file has been
+    #: handled with the request number the file was loaded by and the
+    #: rendered rows (None if there are no more rows).
+    rows_rendered = Signal(object, object)
+
+    def __init__(self):
+        """Initializes the renderer."""
+        super(Renderer, self).__init__()
+        #: AsciiDoc renderer, reused for every document.
+        self.asciidoc = AsciiDocAPI()
+        # Persist the loaded AsciiDoc configuration between sessions.
+        self.asciidoc.options('--conf-cache')
+        self.asciidoc.cache = OutputCache(RENDER_CACHE_SIZE)
+        #: Number of the most recent load request, set by the requester.
+        self.job = 0
+        #: Paging of the CSV file loaded last (load request number, path,
+        #: offset of the following rows and number of columns), None if the
+        #: last document is not a CSV file.
+        self.csvpage = None
+
+    @Slot(object, object, object, object, object)
+    def load(self, job, docpath, tmpdir, sources, digest):
+        """Handles load request number job: prepares the given document and
+        renders it, unless the sources it was last rendered from still match
+        the given digest."""
+        if job != self.job:
+            return
+        # NOTE: The digest is taken before rendering so that changes made
+        # during the render trigger another one.
+        newdigest = filedigest(sources)
+        if newdigest == digest:
+            self.rendered.emit(job, None, None, None, None)
+            return
+        try:
+            page, err_msg, deps = self._prep(job, docpath, tmpdir)
+        except RenderCancelled:
+            return
+        except:
+            page, err_msg, deps = (None, errmsg(), [])
+        self.rendered.emit(job, page, err_msg, deps, newdigest)
+
+    def _prep(self, job, docpath, tmpdir):
+        """Prepares the given document for viewing. Returns the rendered HTML
+        and its base directory (None if there is nothing to display), the
+        error message and the files the document was rendered from."""
+        src = None
+        self.csvpage = None
+        if docpath.endswith(".txt"):
+            src = (docpath, op.dirname(docpath))
+        elif docpath.endswith(".zip"):
+            src = self._prep_archive(docpath, tmpdir)
+        elif docpath.endswith(".csv"):
+            src = self._prep_csv(job, docpath)
+        if not src:
+            return (None, None, [])
+        infile, basedir = src
+        html, err_msg, deps = self.render(infile, job)
+        # NOTE: Whatever was rendered is displayed even if there were errors.
+        return ((html, basedir), err_msg, deps)
+
+    def _prep_archive(self, docpath, tmpdir):
+        """Extracts an archive for viewing. Returns the AsciiDoc file to render
+        and its base directory."""
+        if not op.isdir(tmpdir):
+            os.makedirs(tmpdir)
+        zfile = zipfile.ZipFile(docpath)
+        zfile.extractall(tmpdir)
+
+        path = ""
+
+        # Attempt to locate archive info file.
+        arcinfo = op.join(tmpdir, ARCINFO)
+        if op.exists(arcinfo):
+            path = arcinfo
+
+        # If no archive info file found, attempt to locate any asciidoc text file.
+        if not path:
+            txts = findfile("*.txt", tmpdir)
+            if txts:
+                path = txts[0]
+
+        # If no text file path was found, bail.
+        if not path:
+            return
+
+        return (path, op.dirname(path))
+
+    def _prep_csv(self, job, docpath):
+        """Prepares the first rows of a CSV file for viewing, the following
+        rows are rendered on request. Returns the AsciiDoc source to render
+        and its base directory."""
+        rows, offset = read_csv(docpath, 0, CSV_PAGE_ROWS)
+        cols = len(rows[0]) if rows else 0
+        self.csvpage = (job, docpath, offset, cols)
+        src = StringIO()
+        src.write(csv_table(rows, cols))
+        src.write('\n[subs="none"]\n')
+        src.write("++++\n" + CSVJS + "\n++++\n")
+        src.seek(0)
+        return (src, op.dirname(docpath))
+
+    @Slot(object)
+    def more(self, job):
+        """Handles a request for the following rows of the CSV file loaded by
+        load request number job."""
+        if job != self.job or not self.csvpage or self.csvpage[0] != job:
+            return
+        _, docpath, offset, cols = self.csvpage
+        rows = None
+        try:
+            page, offset = read_csv(docpath, offset, CSV_PAGE_ROWS)
+            if page:
+                html, _, _ = self.render(StringIO(csv_table(page, cols)), job)
+                rows = table_rows(html)
+        except RenderCancelled:
+            return
+        except (IOError, csv.Error):
+            # NOTE: The file changed, the watcher reloads it.
+            pass
+        self.csvpage = (job, docpath, offset, cols) if rows else None
+        self.rows_rendered.emit(job, rows)
+
+    def render(self, infile, job=None):
+        """Renders the given AsciiDoc file path or file object to HTML in
+        memory. Returns the HTML, the error message (None if there was no
+        error) and the files the document was rendered from. Raises
+        RenderCancelled if load request number job is superseded."""
+        stale = lambda: job is not None and job != self.job
+        outfile = RenderOutput(stale)
+        err_msg = None
+        try:
+            self.asciidoc.execute(infile, outfile)
+        except:
+            if stale():
+                raise RenderCancelled()
+            err_msg = errmsg()
+        return (outfile.getvalue(), err_msg, self.asciidoc.dependencies)
+
 class DoctrineApp(QApplication):
     """The main Doctrine application."""
 
+    #: Requests the renderer to load a document.
+    load_requested = Signal(object, object, object, object, object)
+
+    #: Requests the renderer to render the following rows of a CSV file.
+    more_requested = Signal(object)
+
     def __init__(self, *args, **kwargs):
         """Initializes the application."""
         super(DoctrineApp, self).__init__(*args, **kwargs)
@@ -81,10 +329,52 @@ class DoctrineApp(QApplication):
         self._init_ui()
         self.deldoc = False
         self.docpath = None
-        #: Path to the temporary rendered document.
+        #: Rendered HTML of the current document.
+        self.html = None
+        #: Directory that relative links in the rendered HTML refer to.
+        self.basedir = None
+        #: Path to the temporary rendered document, written only for display
+        #: in an external browser.
         self.tmppath = None
-        #: Path to a temporary directory, if needed.
+        #: Temporary directory the displayed archive was extracted to, None
+        #: if there is none.
         self.tmpdir = None
+        #: Temporary directories of the pending load requests of archives by
+        #: request number.
+        self.tmpdirs = {}
+        #: Files the current document was rendered from.
+        self.deps = []
+        #: Digest of the files the current document was rendered from.
+        self.digest = None
+        #: Number of the most recent load request.
+        self.job = 0
+        #: Pending load request (number, previous document path, reload
+        #: flag), None if there is none.
+        self.loading = None
+
+        # Set up the renderer thread.
+        self.renderer = Renderer()
+        self.render_thread = QThread()
+        self.renderer.moveToThread(self.render_thread)
+        self.load_requested.connect(self.renderer.load)
+        self.more_requested.connect(self.renderer.more)
+        self.renderer.rendered.connect(self._handle_rendered)
+        self.renderer.rows_rendered.connect(self._handle_rows)
+        self.render_thread.start()
+
+        # Expose the application to the scripts of displayed documents.
+        self.bridge = PageBridge(self)
+        self.bridge.more_requested.connect(self._handle_more)
+        frame = self.mainwin.webview.view.page().mainFrame()
+        frame.javaScriptWindowObjectCleared.connect(self._handle_js_cleared)
+
+        # Set up automatic reloading when the document files change.
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._handle_file_changed)
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(AUTORELOAD_DELAY)
+        self.reload_timer.timeout.connect(self._handle_autoreload)
 
     def _init_ui(self):
         """Initializes the UI."""
@@ -193,17 +483,24 @@ class DoctrineApp(QApplication):
 
     def _handle_quit(self):
         """Handles quitting the application."""
+        self.reload_timer.stop()
+        # NOTE: Abandons any render in progress.
+        self.renderer.job = -1
+        self.render_thread.quit()
+        self.render_thread.wait()
         self._delete_tmppath()
-        self._delete_tmpdir()
+        self._delete_tmpdir(self.tmpdir)
+        for tmpdir in self.tmpdirs.values():
+            self._delete_tmpdir(tmpdir)
 
     def _handle_display(self):
-        """Handles displaying the document in the web view."""
-        if not self.docpath:
+        """Handles displaying the document in the default browser."""
+        if not self.docpath or not self.html:
             return
         if not self.tmppath:
-            self._load_doc(reload_=True)
-        if not self.tmppath:
-            return
+            self.tmppath = getuniqname(self.basedir, DOCEXT, DOCPRE)
+        with open(self.tmppath, "wb") as f:
+            f.write(self.html)
         webbrowser.open(self.tmppath)
 
     def _handle_reload(self):
@@ -211,6 +508,93 @@ class DoctrineApp(QApplication):
         if self.docpath:
             self._load_doc(reload_=True)
 
+    def _handle_file_changed(self, path):
+        """Handles changes to the files the document was rendered from."""
+        # NOTE: Editors that save by replacing the file remove it from the
+        # watcher.
+        if op.isfile(path) and path not in self.watcher.files():
+            self.watcher.addPath(path)
+        self.reload_timer.start()
+
+    def _handle_autoreload(self):
+        """Handles reloading the document after its files changed."""
+        if not self.docpath:
+            return
+        # NOTE: Wait for a pending load to finish, its digest tells whether
+        # the changes were rendered.
+        if self.loading:
+            self.reload_timer.start()
+            return
+        self._load_doc(reload_=True, digest=self.digest)
+
+    def _handle_rendered(self, job, page, err_msg, deps, digest):
+        """Handles the renderer finishing a load request."""
+        # NOTE: The renderer is done with the directories of this and all
+        # earlier requests, those not displayed are deleted.
+        tmpdir = self.tmpdirs.pop(job, None)
+        for j in [j for j in self.tmpdirs if j < job]:
+            self._delete_tmpdir(self.tmpdirs.pop(j))
+        # NOTE: Results of superseded requests are dropped.
+        if job != self.job:
+            self._delete_tmpdir(tmpdir)
+            return
+        _, prev, reload_ = self.loading
+        self.loading = None
+        self.restoreOverrideCursor()
+        if err_msg:
+            self.mainwin.show_error_msg(err_msg)
+
+        # NOTE: Page is populated only if ready to display output.
+        if page:
+            self.deps = deps
+            self.digest = digest
+            self._show_page(page, reload_)
+            self._watch()
+            if self.tmpdir:
+                # NOTE: The HTML written for an external browser is in the
+                # replaced directory.
+                self.tmppath = None
+            self._delete_tmpdir(self.tmpdir)
+            self.tmpdir = tmpdir
+        else:
+            self._delete_tmpdir(tmpdir)
+            if prev:
+                self.docpath = prev
+
+    def _handle_js_cleared(self):
+        """Handles the scripts of the displayed page being reset."""
+        frame = self.mainwin.webview.view.page().mainFrame()
+        frame.addToJavaScriptWindowObject("doctrine", self.bridge)
+
+    def _handle_more(self):
+        """Handles the displayed CSV file requesting its following rows."""
+        # NOTE: A pending load replaces the displayed document.
+        if self.loading or not self.html:
+            return
+        self.more_requested.emit(self.job)
+
+    def _handle_rows(self, job, rows):
+        """Handles the renderer finishing a request for the following rows of
+        the displayed CSV file."""
+        if job != self.job or self.loading:
+            return
+        end = self.html.rfind("</tbody>")
+        if rows and end != -1:
+            # Keep the rows for display in an external browser.
+            self.html = self.html[:end] + rows + self.html[end:]
+        try:
+            # NOTE: AsciiDoc passes the bytes of the CSV file through, they
+            # need not be valid UTF-8.
+            if rows:
+                rows = rows.decode("utf-8", "replace")
+            script = ROWSJS % json.dumps(rows)
+        except:
+            # NOTE: Paging stops, the page would otherwise keep waiting for
+            # the rows.
+            script = ROWSJS % "null"
+        frame = self.mainwin.webview.view.page().mainFrame()
+        frame.evaluateJavaScript(script)
+
     def _display_find(self):
         """Displays the find dialog."""
         self.mainwin.find_dlog.show()
@@ -224,6 +608,16 @@ class DoctrineApp(QApplication):
             webbrowser.open(str(url.toString()))
             return
 
+        # Scroll to anchors within the displayed page.
+        # NOTE: Rendered documents are displayed from memory with their
+        # directory as the base URL, links to their own anchors resolve to
+        # that directory.
+        frame = self.mainwin.webview.view.page().mainFrame()
+        if url.hasFragment() and (url.toString(QUrl.RemoveFragment) ==
+                frame.baseUrl().toString(QUrl.RemoveFragment)):
+            frame.scrollToAnchor(url.fragment())
+            return
+
         # Open links to Asciidoc files in Doctrine.
         if is_asciidoc(url2path(url)):
             self._load_doc(url2path(url))
@@ -237,115 +631,97 @@ class DoctrineApp(QApplication):
         path = self.mainwin.show_open_file(format_filter(FILETYPES))
         self._load_doc(path)
 
-    def _load_doc(self, path="", reload_=False):
-        """Handles loading the document to view."""
+    def _load_doc(self, path="", reload_=False, digest=None):
+        """Handles loading the document to view. The document is rendered by
+        the renderer thread, a digest of the files it was last rendered from
+        skips the render if they are unchanged."""
         # Delete existing temp files.
+        # NOTE: The displayed archive's directory is deleted once the
+        # document is replaced.
         self._delete_tmppath()
-        self._delete_tmpdir()
 
         # If not reloading the previous document, clear out tmppath.
         if not reload_:
             self.tmppath = None
-            self.tmpdir = None
 
         # Set the doc path.
-        prev = self.docpath
+        # NOTE: The previous path is that of the displayed document.
+        prev = self.loading[1] if self.loading else self.docpath
         if path:
             self.docpath = path
         if not self.docpath:
             return
         self.docpath = op.abspath(self.docpath)
-
-        self.setOverrideCursor(QCursor(Qt.WaitCursor))
-
-        # Attempt to prepare the document for display.
-        url = ""
-        if self.docpath.endswith(".txt"):
-            url = self._prep_text()
-        elif self.docpath.endswith(".zip"):
-            url = self._prep_archive()
-        elif self.docpath.endswith(".csv"):
-            url = self._prep_csv()
-
-        # NOTE: URL is populated only if ready to display output.
-        if url:
-            self.mainwin.webview.view.load(url)
-            self.mainwin.actn_reload.setDisabled(False)
-            self.mainwin.actn_display.setDisabled(False)
-            self.mainwin.menu_navi.setDisabled(False)
-            self.mainwin.setWindowTitle("%s (%s) - %s" % (
-                op.basename(self.docpath),
-                op.dirname(self.docpath),
-                NAMEVER))
-        elif prev:
-            self.docpath = prev
-
-        self.restoreOverrideCursor()
-
-    def _prep_text(self):
-        """Prepares a text document for viewing."""
-        if not self.docpath:
-            return
-        if not self.tmppath:
-            self.tmppath = getuniqname(op.dirname(self.docpath), DOCEXT, DOCPRE)
-        try:
-            AsciiDocAPI().execute(self.docpath, self.tmppath)
-        except:
-            self.restoreOverrideCursor()
-            err_msg = str(sys.exc_info()[0])
-            err_msg += "\n"
-            err_msg += str(sys.exc_info()[1])
-            self.mainwin.show_error_msg(err_msg)
-        return QUrl().fromLocalFile(self.tmppath)
-
-    def _prep_archive(self):
-        """Prepares an archive for viewing."""
-        if not self.docpath:
-            return
-        if not self.tmpdir:
-            self.tmpdir = tempfile.mkdtemp()
-        if self.tmpdir and not op.isdir(self.tmpdir):
-            os.makedirs(self.tmpdir)
-        zfile = zipfile.ZipFile(self.docpath)
-        zfile.extractall(self.tmpdir)
-
-        path = ""
-
-        # Attempt to locate archive info file.
-        arcinfo = op.join(self.tmpdir, ARCINFO)
-        if op.exists(arcinfo):
-            path = arcinfo
-
-        # If no archive info file found, attempt to locate any asciidoc text file.
-        if not path:
-            txts = findfile("*.txt", self.tmpdir)
-            if txts:
-                path = txts[0]
-
-        # If no text file path was found, bail.
-        if not path:
-            return
-
-        if not self.tmppath:
-            self.tmppath = getuniqname(op.dirname(path), DOCEXT, DOCPRE)
-        AsciiDocAPI().execute(path, self.tmppath)
-        return QUrl().fromLocalFile(self.tmppath)
-
-    def _prep_csv(self):
-        """Prepares a CSV file for viewing."""
-        if not self.docpath:
-            return
-        if not self.tmppath:
-            self.tmppath = getuniqname(op.dirname(self.docpath), DOCEXT, DOCPRE)
-        path = getuniqname(op.dirname(self.docpath), ".txt", "__temp-")
-        with open(path, "w") as f:
-            f.write('[format="csv"]\n')
-            f.write("|===\n")
-            f.write("include::" + self.docpath + "[]\n")
-            f.write("|===\n")
-        AsciiDocAPI().execute(path, self.tmppath)
-        os.remove(path)
-        return QUrl().fromLocalFile(self.tmppath)
+        sources = self._sources() if self.docpath == prev else [self.docpath]
+
+        # NOTE: Supersedes any pending request, the wait cursor is already
+        # set for it.
+        if not self.loading:
+            self.setOverrideCursor(QCursor(Qt.WaitCursor))
+        self.job += 1
+        self.renderer.job = self.job
+        # NOTE: Archives are extracted to a new directory for every request
+        # so the displayed one is left intact.
+        tmpdir = None
+        if self.docpath.endswith(".zip"):
+            tmpdir = tempfile.mkdtemp()
+            self.tmpdirs[self.job] = tmpdir
+        self.loading = (self.job, prev, reload_)
+        self.load_requested.emit(self.job, self.docpath, tmpdir, sources, digest)
+
+    def _show_page(self, page, reload_=False):
+        """Displays the given rendered HTML and base directory."""
+        if not (reload_ and self._patch_doc(*page)):
+            html, basedir = page
+            # NOTE: The trailing separator makes the base URL a directory.
+            baseurl = QUrl().fromLocalFile(op.join(basedir, ""))
+            self.mainwin.webview.view.setContent(QByteArray(html), "text/html", baseurl)
+        self.html, self.basedir = page
+        self.mainwin.actn_reload.setDisabled(False)
+        self.mainwin.actn_display.setDisabled(False)
+        self.mainwin.menu_navi.setDisabled(False)
+        self.mainwin.setWindowTitle("%s (%s) - %s" % (
+            op.basename(self.docpath),
+            op.dirname(self.docpath),
+            NAMEVER))
+
+    def _sources(self):
+        """Returns the files the current document is rendered from."""
+        paths = [self.docpath]
+        # NOTE: Archives are extracted again on reload, only the archive
+        # itself is a source.
+        if not self.docpath.endswith(".zip"):
+            paths += [p for p in self.deps if p not in paths]
+        return paths
+
+    def _watch(self):
+        """Watches the files the current document is rendered from."""
+        watched = self.watcher.files()
+        if watched:
+            self.watcher.removePaths(watched)
+        paths = [p for p in self._sources() if op.isfile(p)]
+        if paths:
+            self.watcher.addPaths(paths)
+
+    def _patch_doc(self, html, basedir):
+        """Updates the displayed document to the given re-rendered HTML by
+        replacing only the sections that changed, which keeps the scroll
+        position. Returns false if the document has to be reloaded."""
+        if not self.html or basedir != self.basedir:
+            return False
+        # NOTE: The following rows of CSV files are rendered again on request.
+        if self.docpath.endswith(".csv"):
+            return False
+        frame = self.mainwin.webview.view.page().mainFrame()
+        # NOTE: The view may have navigated away from the document.
+        if frame.baseUrl() != QUrl().fromLocalFile(op.join(basedir, "")):
+            return False
+        patches = diff_blocks(self.html, html)
+        if patches is None:
+            return False
+        for script in patches:
+            frame.evaluateJavaScript(script)
+        return True
 
     def _delete_tmppath(self):
         """Deletes the rendered HTML."""
@@ -361,12 +737,12 @@ class DoctrineApp(QApplication):
                 time.sleep(0.1)
                 retries -= 1
 
-    def _delete_tmpdir(self):
-        """Deletes the temporary directory."""
-        if not self.tmpdir:
+    def _delete_tmpdir(self, tmpdir):
+        """Deletes the given temporary directory, if any."""
+        if not tmpdir:
             return
-        if op.exists(self.tmpdir):
-            shutil.rmtree(self.tmpdir)
+        if op.exists(tmpdir):
+            shutil.rmtree(tmpdir)
 
     def show_main(self):
         """Shows the main view of the application."""
@@ -392,6 +768,117 @@ def getuniqname(base, ext, pre=""):
             break
     return op.normpath(uniq)
 
+def errmsg():
+    """Returns the message of the exception being handled."""
+    err_msg = str(sys.exc_info()[0])
+    err_msg += "\n"
+    err_msg += str(sys.exc_info()[1])
+    return err_msg
+
+def filedigest(paths):
+    """Returns a digest of the names and contents of the given files."""
+    sha = hashlib.sha1()
+    for path in paths:
+        sha.update(path + "\0")
+        try:
+            with open(path, "rb") as f:
+                sha.update(f.read())
+        except IOError:
+            sha.update("\0")
+    return sha.hexdigest()
+
+def read_csv(path, offset, count):
+    """Reads up to count rows of the given CSV file starting at the given byte
+    offset. Returns the rows and the offset of the rows following them."""
+    rows = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        # NOTE: Lines are read one at a time so that the file position
+        # follows the rows read.
+        for row in csv.reader(iter(f.readline, ""), skipinitialspace=True):
+            if row:
+                rows.append(row)
+            if len(rows) == count:
+                break
+        return (rows, f.tell())
+
+def csv_table(rows, cols=0):
+    """Returns the AsciiDoc source of a table of the given CSV rows with the
+    given number of columns (taken from the first row if 0). Only the special
+    characters of the cells are escaped."""
+    src = StringIO()
+    src.write('[format="csv",style="plain"')
+    if cols:
+        src.write(',cols="%d"' % cols)
+    src.write(']\n|===\n')
+    csv.writer(src, lineterminator="\n").writerows(rows)
+    src.write("|===\n")
+    return src.getvalue()
+
+def table_rows(html):
+    """Returns the rows of the last table body in the given rendered HTML,
+    None if there is none."""
+    end = html.rfind("</tbody>")
+    start = html.rfind("<tbody>", 0, end)
+    if start == -1 or end == -1:
+        return None
+    return html[start + len("<tbody>"):end]
+
+def split_blocks(html):
+    """Splits the given rendered HTML into its patchable blocks. Returns the
+    HTML with the blocks removed and a list of (kind, index, block) tuples."""
+    blocks = []
+    rest = []
+    pos = 0
+    while True:
+        found = [(html.find(stag, pos), kind) for kind, (stag, _) in enumerate(PATCHABLE)]
+        found = [f for f in found if f[0] != -1]
+        if not found:
+            break
+        start, kind = min(found)
+        # Find the matching end tag.
+        depth = 0
+        for mo in DIVTAG.finditer(html, start):
+            depth += 1 if mo.group() == "<div" else -1
+            if not depth:
+                break
+        if depth:
+            break
+        end = mo.end()
+        index = len([b for b in blocks if b[0] == kind])
+        blocks.append((kind, index, html[start:end]))
+        rest.append(html[pos:start])
+        pos = end
+    rest.append(html[pos:])
+    return "".join(rest), blocks
+
+def diff_blocks(old, new):
+    """Returns the scripts that patch a document displaying the old rendered
+    HTML into the new one. Returns None if the document has to be reloaded
+    instead, i.e. the changes are not confined to patchable blocks or the
+    scripts run when the document is loaded (table of contents, footnotes)
+    would generate different content."""
+    old_rest, old_blocks = split_blocks(old)
+    new_rest, new_blocks = split_blocks(new)
+    if old_rest != new_rest or len(old_blocks) != len(new_blocks):
+        return None
+    if HEADING.findall(old) != HEADING.findall(new):
+        return None
+    scripts = []
+    for (kind, index, block), (new_kind, _, new_block) in zip(old_blocks, new_blocks):
+        if kind != new_kind:
+            return None
+        if block == new_block:
+            continue
+        if 'class="footnote' in block or 'class="footnote' in new_block:
+            return None
+        try:
+            block = json.dumps(new_block)
+        except ValueError:
+            return None
+        scripts.append(PATCHJS % (PATCHABLE[kind][1], index, block))
+    return scripts
+
 def is_webpage(url):
     """Returns true if the given URL is for a webpage (rather than a local file)."""
     # Handle types.